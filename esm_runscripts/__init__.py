@@ -4,16 +4,66 @@ __author__ = """Dirk Barbi"""
 __email__ = 'dirk.barbi@awi.de'
 __version__ = "5.1.37"
 
-from .sim_objects import *
-from .batch_system import *
-from .database import *
-from .database_actions import *
-from .compute import *
-from .tidy import *
-from .prepare import *
-from .last_minute import *
-from .postprocess import *
-from .filelists import *
-from .tidy import *
-from .namelists import *
-from .virtual_env_builder import *
+import importlib
+import importlib.util
+import sys
+
+# Modules whose public names are available directly from the package, i.e.
+# ``esm_runscripts.SimulationSetup``. They are only imported when one of these
+# names (or the module itself) is used for the first time, so that starting a
+# job does not pay for the import of modules it does not need. If a name is
+# defined in several of these modules, the later one wins, as it did with the
+# ``from .module import *`` imports this list replaces.
+_PUBLIC_MODULES = [
+    "sim_objects",
+    "batch_system",
+    "database",
+    "database_actions",
+    "compute",
+    "prepare",
+    "last_minute",
+    "postprocess",
+    "filelists",
+    "tidy",
+    "namelists",
+    "virtual_env_builder",
+]
+
+
+def __getattr__(name):
+    if name.startswith("__"):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    # Submodules, e.g. ``esm_runscripts.tidy`` for the recipe steps
+    if importlib.util.find_spec(f"{__name__}.{name}") is not None:
+        return importlib.import_module(f".{name}", __name__)
+    for module_name in reversed(_PUBLIC_MODULES):
+        module = importlib.import_module(f".{module_name}", __name__)
+        if not name.startswith("_") and hasattr(module, name):
+            value = getattr(module, name)
+            globals()[name] = value
+            return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    names = set(globals())
+    for module_name in _PUBLIC_MODULES:
+        module = importlib.import_module(f".{module_name}", __name__)
+        names.update(name for name in dir(module) if not name.startswith("_"))
+    return sorted(names)
+
+
+if sys.version_info < (3, 7):
+    # No module ``__getattr__`` before Python 3.7 (PEP 562), import everything
+    from .sim_objects import *
+    from .batch_system import *
+    from .database import *
+    from .database_actions import *
+    from .compute import *
+    from .prepare import *
+    from .last_minute import *
+    from .postprocess import *
+    from .filelists import *
+    from .tidy import *
+    from .namelists import *
+    from .virtual_env_builder import *
@@ -9,10 +9,9 @@ import logging
 import os
 import sys
 
-from .sim_objects import *
-from .helpers import SmartSink
-from loguru import logger
-from esm_motd import check_all_esm_packages
+# NOTE: the imports of ``esm_runscripts`` modules and of the other ESM-Tools
+# packages are done in ``main``, after the command line is parsed, so that
+# ``--help`` and ``--startup-profile`` do not wait for them
 
 
 def parse_shargs():
@@ -120,6 +119,20 @@ def parse_shargs():
         action = "store_true" 
     )
 
+    parser.add_argument(
+        "--no-config-cache",
+        help="parse the configuration again instead of using the cached one",
+        default=False,
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--startup-profile",
+        help="print how long the imports at the start took, by package",
+        default=False,
+        action="store_true",
+    )
+
     return parser.parse_args()
 
 
@@ -128,6 +141,15 @@ def main():
 
     ARGS = parse_shargs()
 
+    if ARGS.startup_profile:
+        from . import startup_profile
+
+        startup_profile.start()
+
+    from loguru import logger
+    from .helpers import SmartSink
+    from .sim_objects import SimulationSetup
+
     check = False
     profile = False
     update = False
@@ -139,6 +161,7 @@ def main():
     use_venv = None
     modify_config_file = None
     no_motd = False
+    no_config_cache = False
 
     parsed_args = vars(ARGS)
 
@@ -172,6 +195,8 @@ def main():
         modify_config_file = parsed_args["modify"]
     if "no_motd" in parsed_args:
         no_motd = parsed_args["no_motd"]
+    if "no_config_cache" in parsed_args:
+        no_config_cache = parsed_args["no_config_cache"]
 
     command_line_config = {}
     command_line_config["check"] = check
@@ -185,6 +210,7 @@ def main():
     command_line_config["inspect"] = inspect
     command_line_config["use_venv"] = use_venv
     command_line_config["no_motd"] = no_motd
+    command_line_config["no_config_cache"] = no_config_cache
     if modify_config_file:
         command_line_config["modify_config_file"] = modify_config_file
 
@@ -221,5 +247,9 @@ def main():
     Setup = SimulationSetup(command_line_config)
     # if not Setup.config['general']['submitted']:
     if not Setup.config['general']['submitted'] and not no_motd:
+        from esm_motd import check_all_esm_packages
+
         check_all_esm_packages()
+    if ARGS.startup_profile:
+        startup_profile.report()
     Setup()
@@ -1,8 +1,8 @@
 import os
 import shutil
 import subprocess
-import copy
 import pathlib
+import pickle
 
 import six
 import yaml
@@ -14,8 +14,14 @@ import esm_parser
 import esm_rcfile
 import esm_runscripts
 
+from . import finished_config
 from .batch_system import batch_system
-from .filelists import copy_files, log_used_files
+from .filelists import (
+    copy_files,
+    log_used_files,
+    plan_file_movements,
+    reset_file_manifest,
+)
 from .helpers import end_it_all, evaluate, write_to_log
 from .namelists import Namelist
 from loguru import logger
@@ -77,6 +83,16 @@ def all_files_to_copy_append(
     if filetype + "_files" in config[model]:
         config[model][filetype + "_files"][categ] = categ
 
+    # Files added after ``filelists.assemble`` built the manifest
+    if "file_manifest" in config["general"]:
+        config["general"]["file_manifest"].add(
+            model,
+            filetype,
+            categ,
+            sources=file_source,
+            intermediate=file_interm,
+            targets=file_target,
+        )
     return config
 
 
@@ -196,6 +212,12 @@ def copy_files_to_thisrun(config):
         six.print_("- You will be informed about missing files")
 
     log_used_files(config)
+    reset_file_manifest(config)
+
+    if config["general"]["check"] or config["general"].get("plan_file_movements"):
+        config = plan_file_movements(
+            config, config["general"]["in_filetypes"], source="init", target="thisrun"
+        )
 
     config = copy_files(
         config, config["general"]["in_filetypes"], source="init", target="thisrun"
@@ -334,8 +356,9 @@ def _write_finalized_config(config):
     def oasis_representer(dumper, oasis):
         return dumper.represent_str(f"{oasis.name}")
 
-    # dumper object for the ESM-Tools configuration
-    class EsmConfigDumper(yaml.dumper.Dumper):
+    # dumper object for the ESM-Tools configuration, with the C emitter of
+    # libyaml if pyyaml was built with it
+    class EsmConfigDumper(getattr(yaml, "CDumper", yaml.dumper.Dumper)):
         pass
 
     # pyyaml does not support tuple and prints !!python/tuple
@@ -363,20 +386,63 @@ def _write_finalized_config(config):
     if "oasis3mct" in config:
         EsmConfigDumper.add_representer(esm_runscripts.oasis.oasis, oasis_representer)
 
+    # Avoid saving ``prev_run`` information in the config file. Only the top
+    # level is rebuilt, the sections themselves are not copied
+    config_final = {
+        key: value for key, value in config.items() if key != "prev_run"
+    }
+    # Nor the table of files built by ``filelists.assemble``, which is already
+    # described by the ``<filetype>_sources``, ... entries of the config
+    config_final["general"] = {
+        key: value
+        for key, value in config["general"].items()
+        if key != "file_manifest"
+    }
+
     config_file_path = \
         f"{config['general']['thisrun_config_dir']}"\
         f"/{config['general']['expid']}_finished_config.yaml"
     with open(config_file_path, "w") as config_file:
-        # Avoid saving ``prev_run`` information in the config file
-        config_final = copy.deepcopy(config) #PrevRunInfo
-        del config_final["prev_run"]         #PrevRunInfo
-
-        out = yaml.dump(config_final, Dumper=EsmConfigDumper, width=10000,
-            indent=4)   #PrevRunInfo
-        config_file.write(out)
+        yaml.dump(config_final, config_file, Dumper=EsmConfigDumper, width=10000,
+            indent=4)
+    # Sidecar for loading single sections, for ``PrevRunInfo``
+    try:
+        finished_config.write_index(config_file_path, list(config_final))
+    except OSError as error:
+        print(f"Could not index {config_file_path}: {error}", flush=True)
+
+    if config["general"].get("finished_config_snapshot", False):
+        _write_finalized_config_snapshot(config, config_final)
     return config
 
 
+def _write_finalized_config_snapshot(config, config_final):
+    """
+    Writes ``config_final`` as a pickle to ``<expid>_finished_config.pkl``, next
+    to ``<expid>_finished_config.yaml``, for tools that reload the finished
+    configuration and do not want to parse the YAML file. Unlike the YAML
+    file, the pickle keeps the ESM-Tools objects (dates, calendar, coupler,
+    ...) as they are, so it can only be loaded where the same packages are
+    installed.
+    """
+    snapshot_path = \
+        f"{config['general']['thisrun_config_dir']}"\
+        f"/{config['general']['expid']}_finished_config.pkl"
+    try:
+        with open(snapshot_path + ".tmp", "wb") as snapshot_file:
+            pickle.dump(
+                config_final,
+                snapshot_file,
+                protocol=min(pickle.HIGHEST_PROTOCOL, 5),
+            )
+        os.replace(snapshot_path + ".tmp", snapshot_path)
+    except Exception as error:
+        # The snapshot is an addition to the YAML file, never fail because of it
+        print(f"Could not write {snapshot_path}: {error}", flush=True)
+        if os.path.exists(snapshot_path + ".tmp"):
+            os.remove(snapshot_path + ".tmp")
+
+
 def color_diff(diff):
     for line in diff:
         if line.startswith('+'):
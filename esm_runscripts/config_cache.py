@@ -0,0 +1,347 @@
+"""
+Reuse of parsed configurations between the ``SimulationSetup`` objects of one
+process.
+
+Building a ``SimulationSetup`` parses the runscript and every configuration
+file of the setup through ``esm_parser.ConfigSetup``, which takes a long time.
+A tidy job builds further ``SimulationSetup`` objects for the next compute job
+(``tidy.maybe_resubmit``) and for the post-processing job
+(``tidy.start_post_job``) from the same runscript. With
+``general.warm_resubmit: True`` the result of the parsing is kept in memory and
+reused by these objects, as long as the fingerprint of the input files (see
+``input_fingerprint``) did not change. The prepare recipe still runs on the
+reused configuration, so that dates, run numbers and everything that depends on
+them are derived for the new job as usual.
+
+The values given in the command line (``jobtype``, ``last_jobtype``, ...) are
+updated in ``general`` of the reused configuration. Choices that
+``ConfigSetup`` makes on these values while parsing are not reevaluated, which
+is why the reuse needs to be switched on explicitly.
+
+With ``general.config_cache: True``, the same result is also kept on disk
+across processes, in the ``.config_cache`` folder of the experiment (see
+``load_cached_config`` and ``store_cached_config``). A cached configuration is
+reused by a later call of ``esm_runscripts`` with the same runscript, command
+line options, environment and versions, if the content of all its input files
+is still the same. Only the runscript, its additional files and the YAML files
+of the ``esm_tools`` configuration folder are checked: files included from
+elsewhere (i.e. through ``further_reading``) are not, which is why the disk
+cache also needs to be switched on explicitly. It is skipped with
+``--no-config-cache``.
+"""
+import copy
+import hashlib
+import json
+import os
+import pickle
+import sys
+
+import esm_rcfile
+
+# Number of configurations kept in the disk cache of an experiment
+DISK_CACHE_ENTRIES = 8
+
+# Command line options that do not influence the parsing of the configuration
+_VOLATILE_OPTIONS = ["launcher_pid", "original_command", "no_config_cache"]
+
+# Parsed configurations of this process, by runscript path
+_warm_configs = {}
+
+# Marks that the runscript does not define ``use_venv``
+_NO_USE_VENV = object()
+
+
+def input_files(command_line_config, additional_files=()):
+    """
+    Returns the files that are read when the configuration of
+    ``command_line_config`` is parsed: the runscript, its additional files and
+    the YAML files of the ``esm_tools`` configuration folder.
+    """
+    runscript = command_line_config["runscript_abspath"]
+    started_from = command_line_config.get("started_from", os.path.dirname(runscript))
+    files = [runscript]
+    files.extend(os.path.join(started_from, tfile) for tfile in additional_files)
+    function_path = esm_rcfile.EsmToolsDir("FUNCTION_PATH")
+    stack = [function_path]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as scanned:
+                for entry in scanned:
+                    if entry.is_dir():
+                        stack.append(entry.path)
+                    elif entry.name.endswith((".yaml", ".yml")):
+                        files.append(entry.path)
+        except OSError:
+            continue
+    return sorted(files)
+
+
+def input_fingerprint(files, content=False):
+    """
+    Returns a hash of the paths, sizes and modification times of ``files``,
+    or of their paths and content if ``content`` is ``True``. Missing files
+    are part of the fingerprint too.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for path in files:
+        try:
+            if content:
+                with open(path, "rb") as input_file:
+                    file_hash = hashlib.blake2b(input_file.read(), digest_size=16)
+                signature = f"{path}\0{file_hash.hexdigest()}\n"
+            else:
+                stat = os.stat(path)
+                signature = f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n"
+        except OSError:
+            signature = f"{path}\0missing\n"
+        digest.update(signature.encode())
+    return digest.hexdigest()
+
+
+def _runscript_use_venv(command_line_config, user_config):
+    """
+    Returns ``use_venv`` of the runscript, which wins over the command line
+    (see ``SimulationSetup.get_user_config_from_command_line``), or
+    ``_NO_USE_VENV`` if the runscript does not define it.
+    """
+    user_use_venv = user_config["general"].get("use_venv", _NO_USE_VENV)
+    if user_use_venv == command_line_config.get("use_venv", _NO_USE_VENV):
+        return _NO_USE_VENV
+    return user_use_venv
+
+
+def _apply_command_line(config, command_line_config, user_use_venv):
+    # Same precedence as in ``SimulationSetup.get_user_config_from_command_line``:
+    # the command line wins, except for a ``use_venv`` set in the runscript
+    config["general"].update(command_line_config)
+    if user_use_venv is not _NO_USE_VENV:
+        config["general"]["use_venv"] = user_use_venv
+    config["computer"]["jobtype"] = config["general"]["jobtype"]
+    return config
+
+
+def store_warm_config(config, command_line_config, user_config):
+    """
+    Keeps a copy of ``config``, the result of
+    ``SimulationSetup.get_total_config_from_user_config``, for the next
+    ``SimulationSetup`` of this process with the same runscript. Only done if
+    ``general.warm_resubmit`` is set.
+    """
+    if not config["general"].get("warm_resubmit", False):
+        return
+    runscript = command_line_config.get("runscript_abspath")
+    if not runscript:
+        return
+    files = input_files(
+        command_line_config, config["general"].get("additional_files", [])
+    )
+    try:
+        snapshot = copy.deepcopy(config)
+    except Exception:
+        return
+    _warm_configs[runscript] = (
+        files,
+        input_fingerprint(files),
+        snapshot,
+        _runscript_use_venv(command_line_config, user_config),
+    )
+
+
+def get_warm_config(command_line_config):
+    """
+    Returns a copy of the configuration parsed earlier in this process for the
+    runscript of ``command_line_config``, updated with the values of the command
+    line, or ``None`` if there is none, if any of its input files changed or
+    if ``--no-config-cache`` was given.
+    """
+    runscript = command_line_config.get("runscript_abspath")
+    if command_line_config.get("no_config_cache", False):
+        return None
+    if runscript not in _warm_configs:
+        return None
+    files, fingerprint, snapshot, user_use_venv = _warm_configs[runscript]
+    if input_fingerprint(files) != fingerprint:
+        del _warm_configs[runscript]
+        return None
+    config = _apply_command_line(
+        copy.deepcopy(snapshot), command_line_config, user_use_venv
+    )
+    if config["general"]["verbose"]:
+        print(f"Reusing the parsed configuration of {runscript}", flush=True)
+    return config
+
+
+def find_experiment_dir(command_line_config):
+    """
+    Returns the experiment folder containing the folder ``esm_runscripts`` was
+    started from, found through the ``.top_of_exp_tree`` marker, or ``None``
+    if it was started from outside of an experiment.
+    """
+    directory = os.path.realpath(
+        command_line_config.get(
+            "started_from", os.path.dirname(command_line_config["runscript_abspath"])
+        )
+    )
+    while True:
+        if os.path.isfile(os.path.join(directory, ".top_of_exp_tree")):
+            return directory
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+def cache_key(command_line_config):
+    """
+    Returns the key of the disk cache entry for ``command_line_config``, a
+    hash of the runscript path, the command line options, the relevant
+    environment variables and the versions of Python and of the ESM-Tools
+    packages. The content of the input files is checked separately.
+    """
+    options = {
+        key: value
+        for key, value in command_line_config.items()
+        if key not in _VOLATILE_OPTIONS
+    }
+    environment = {
+        key: value
+        for key, value in os.environ.items()
+        if key in ["USER", "HOME"] or key.startswith("ESM_")
+    }
+    versions = {"python": sys.version}
+    for package in ["esm_parser", "esm_tools", "esm_runscripts"]:
+        module = sys.modules.get(package)
+        versions[package] = getattr(module, "__version__", None)
+    description = json.dumps(
+        [options, environment, versions], sort_keys=True, default=str
+    )
+    return hashlib.blake2b(description.encode(), digest_size=16).hexdigest()
+
+
+def _cache_paths(experiment_dir, key):
+    cache_dir = os.path.join(experiment_dir, ".config_cache")
+    return (
+        cache_dir,
+        os.path.join(cache_dir, key + ".json"),
+        os.path.join(cache_dir, key + ".pkl"),
+    )
+
+
+def _modify_config_files(command_line_config):
+    modify_config_file = command_line_config.get("modify_config_file")
+    if not modify_config_file:
+        return []
+    started_from = command_line_config.get("started_from", "")
+    return [os.path.join(started_from, modify_config_file)]
+
+
+def load_cached_config(command_line_config):
+    """
+    Returns the configuration cached on disk for ``command_line_config``,
+    updated with the values of the command line, or ``None`` if there is no
+    valid entry.
+    """
+    verbose = command_line_config.get("verbose", False)
+    if command_line_config.get("no_config_cache", False):
+        return None
+    experiment_dir = find_experiment_dir(command_line_config)
+    if not experiment_dir:
+        return None
+    _, info_path, config_path = _cache_paths(
+        experiment_dir, cache_key(command_line_config)
+    )
+    try:
+        with open(info_path, "r") as info_file:
+            info = json.load(info_file)
+    except (OSError, ValueError):
+        if verbose:
+            print("Configuration cache miss: no entry", flush=True)
+        return None
+    if input_fingerprint(info["files"], content=True) != info["fingerprint"]:
+        if verbose:
+            print("Configuration cache miss: input files changed", flush=True)
+        return None
+    try:
+        with open(config_path, "rb") as config_file:
+            config = pickle.load(config_file)
+    except Exception:
+        if verbose:
+            print("Configuration cache miss: entry not readable", flush=True)
+        return None
+    if not config["general"].get("config_cache", False):
+        # i.e. an entry written when the disk cache was not opt-in yet
+        if verbose:
+            print("Configuration cache miss: cache not switched on", flush=True)
+        return None
+    user_use_venv = info.get("use_venv", _NO_USE_VENV)
+    if info.get("runscript_use_venv", False) is False:
+        user_use_venv = _NO_USE_VENV
+    config = _apply_command_line(config, command_line_config, user_use_venv)
+    if verbose:
+        print(f"Configuration cache hit: {config_path}", flush=True)
+    return config
+
+
+def store_cached_config(config, command_line_config, user_config):
+    """
+    Writes ``config``, the result of
+    ``SimulationSetup.get_total_config_from_user_config``, into the disk cache
+    of the experiment, if ``general.config_cache`` is set and the experiment
+    folder exists already. Only the ``DISK_CACHE_ENTRIES`` most recent entries
+    are kept.
+    """
+    if not config["general"].get("config_cache", False):
+        return
+    experiment_dir = config["general"].get("experiment_dir")
+    if not experiment_dir or not os.path.isdir(experiment_dir):
+        return
+    if "runscript_abspath" not in command_line_config:
+        return
+    cache_dir, info_path, config_path = _cache_paths(
+        experiment_dir, cache_key(command_line_config)
+    )
+    files = sorted(
+        set(
+            input_files(
+                command_line_config, config["general"].get("additional_files", [])
+            )
+            + _modify_config_files(command_line_config)
+        )
+    )
+    user_use_venv = _runscript_use_venv(command_line_config, user_config)
+    info = {
+        "files": files,
+        "fingerprint": input_fingerprint(files, content=True),
+        "runscript_use_venv": user_use_venv is not _NO_USE_VENV,
+        "use_venv": None if user_use_venv is _NO_USE_VENV else user_use_venv,
+    }
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_suffix = f".{os.getpid()}.tmp"
+        with open(config_path + tmp_suffix, "wb") as config_file:
+            pickle.dump(config, config_file, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(info_path + tmp_suffix, "w") as info_file:
+            json.dump(info, info_file)
+        os.replace(config_path + tmp_suffix, config_path)
+        os.replace(info_path + tmp_suffix, info_path)
+    except Exception as error:
+        # The cache is only an optimization, never fail because of it
+        if config["general"].get("verbose", False):
+            print(f"Could not write the configuration cache: {error}", flush=True)
+        return
+
+    entries = sorted(
+        (
+            os.path.join(cache_dir, name)
+            for name in os.listdir(cache_dir)
+            if name.endswith(".json")
+        ),
+        key=os.path.getmtime,
+    )
+    for old_info_path in entries[:-DISK_CACHE_ENTRIES]:
+        for old_path in [old_info_path, old_info_path[: -len(".json")] + ".pkl"]:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
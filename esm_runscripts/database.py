@@ -3,6 +3,7 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 import os
+import sys
 #database_file = os.path.dirname(os.path.abspath(__file__)) + "/../database/esm_runscripts.db"
 database_file = os.path.expanduser("~") + "/.esm_tools/esm_runscripts.db"
 if not os.path.isdir(os.path.expanduser("~") + "/.esm_tools"):
@@ -10,7 +11,6 @@ if not os.path.isdir(os.path.expanduser("~") + "/.esm_tools"):
 
 from esm_database import location_database
 
-engine = create_engine('sqlite:///' + database_file, echo = False)
 base = declarative_base()
 
 
@@ -77,8 +77,46 @@ class experiment(base):
                 )
 
 
-base.metadata.create_all(engine)
-connection = engine.connect()
-Session = sessionmaker(bind=engine)
-Session.configure(bind=engine)
-session = Session()
+_engine = None
+_session = None
+
+
+def get_engine():
+    """
+    Returns the engine of the experiment database, created (together with the
+    table) the first time it is needed rather than when this module is
+    imported.
+    """
+    global _engine
+    if _engine is None:
+        _engine = create_engine('sqlite:///' + database_file, echo = False)
+        base.metadata.create_all(_engine)
+    return _engine
+
+
+def get_session():
+    """
+    Returns the session of the experiment database, opened the first time it
+    is needed.
+    """
+    global _session
+    if _session is None:
+        Session = sessionmaker(bind=get_engine())
+        _session = Session()
+    return _session
+
+
+def __getattr__(name):
+    # ``engine`` and ``session`` used to be created on import, keep them
+    # available as module attributes
+    if name == "engine":
+        return get_engine()
+    if name == "session":
+        return get_session()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+if sys.version_info < (3, 7):
+    # No module ``__getattr__`` before Python 3.7 (PEP 562), create them now
+    engine = get_engine()
+    session = get_session()
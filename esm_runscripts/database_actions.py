@@ -1,6 +1,4 @@
-from . import database
 from datetime import datetime
-import sqlalchemy
 
 def database_entry(config):
     if config.get("general", {}).get("use_database", True):
@@ -11,7 +9,11 @@ def database_entry(config):
     return config
 
 def database_basic_entry(config):
-    thisrun = database.session.query(database.experiment).filter_by(expid = config["general"]["expid"]).filter_by(run_timestamp = config["general"]["run_datestamp"]).all()
+    # NOTE: imported here, so that SQLAlchemy is only loaded by the jobs that
+    # write into the database
+    from . import database
+
+    thisrun = database.get_session().query(database.experiment).filter_by(expid = config["general"]["expid"]).filter_by(run_timestamp = config["general"]["run_datestamp"]).all()
 
     if thisrun == []:
         thisrun = database.experiment(
@@ -23,7 +25,7 @@ def database_basic_entry(config):
             exp_folder = \
                 f"{config['general']['base_dir']}/{config['general']['expid']}/"
         )
-        database.session.add(thisrun)
+        database.get_session().add(thisrun)
     else:
         thisrun = thisrun[-1]
         thisrun.timestamp = datetime.now()
@@ -31,8 +33,11 @@ def database_basic_entry(config):
 
 
 def try_to_commit():
+    import sqlalchemy
+    from . import database
+
     try:
-        database.session.commit()
+        database.get_session().commit()
     except sqlalchemy.exc.OperationalError as e:
         print("Sorry, there was some SQL Error!")
         print(e)
@@ -0,0 +1,115 @@
+"""
+Cached directory listings for the expansion of wildcards in file lists.
+
+Many wildcard sources point into the same (large) forcing or input directories.
+Instead of calling ``glob.glob`` once per pattern, which lists the directory
+and then calls ``os.path.isdir`` on every match, the directory is listed once
+with ``os.scandir`` and every pattern is matched against that listing with
+``fnmatch``. A listing is reused as long as the modification time of the
+directory does not change, so files added in the meantime (e.g. restarts
+harvested by a tidy job before the next run is prepared) are always seen.
+"""
+import fnmatch
+import glob
+import os
+import re
+
+_magic_check = re.compile("[*?[]")
+
+
+def has_magic(pattern):
+    return _magic_check.search(pattern) is not None
+
+
+class DirectoryIndex:
+    """
+    Listings of the directories that wildcard patterns were matched against.
+
+    Attributes
+    ----------
+    listings : int
+        Number of directories actually listed with ``os.scandir``.
+    patterns : int
+        Number of patterns expanded through the index.
+    saved_calls : int
+        Number of metadata calls (directory listings and ``isdir`` checks) that
+        plain ``glob.glob`` calls would have needed on top of those done here.
+    """
+
+    def __init__(self):
+        self._listings = {}
+        self.listings = 0
+        self.patterns = 0
+        self.saved_calls = 0
+
+    def listing(self, directory):
+        """
+        Returns a list of ``(name, is_dir)`` tuples for ``directory``, or an
+        empty list if it cannot be listed.
+        """
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return []
+        cached = self._listings.get(directory)
+        if cached and cached[0] == mtime:
+            self.saved_calls += 1
+            return cached[1]
+
+        entries = []
+        try:
+            with os.scandir(directory) as scanned:
+                for entry in scanned:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    entries.append((entry.name, is_dir))
+        except OSError:
+            return []
+        self.listings += 1
+        self._listings[directory] = (mtime, entries)
+        return entries
+
+    def glob(self, pattern, skip_dirs=True):
+        """
+        Equivalent of ``glob.glob(pattern)`` for patterns with wildcards only in
+        the file name. Patterns with wildcards in the directory part are passed
+        to ``glob.glob``.
+
+        Parameters
+        ----------
+        pattern : str
+            Path with wildcards
+        skip_dirs : bool
+            Leave out directories from the result
+
+        Returns
+        -------
+        matches : list
+        """
+        dirname, basename = os.path.split(pattern)
+        if has_magic(dirname) or not has_magic(basename):
+            matches = glob.glob(pattern)
+            if skip_dirs:
+                matches = [match for match in matches if not os.path.isdir(match)]
+            return matches
+
+        self.patterns += 1
+        include_hidden = basename.startswith(".")
+        matches = []
+        for name, is_dir in self.listing(dirname or os.curdir):
+            if not include_hidden and name.startswith("."):
+                continue
+            if not fnmatch.fnmatch(name, basename):
+                continue
+            if skip_dirs:
+                self.saved_calls += 1
+                if is_dir:
+                    continue
+            matches.append(os.path.join(dirname, name))
+        return matches
+
+
+# Index shared by all wildcard expansions of the process
+shared_index = DirectoryIndex()
@@ -0,0 +1,235 @@
+"""
+Flat table of the files handled by ``esm_runscripts``, built from the
+``<filetype>_sources``, ``<filetype>_intermediate`` and ``<filetype>_targets``
+dictionaries that ``filelists.assemble`` leaves in the config.
+
+``filelists.assemble`` builds the table once, in a single pass over the models,
+and keeps it in ``general.file_manifest``. ``copy_files``, ``log_used_files``,
+``check_for_unknown_files`` and ``plan_file_movements`` take the files they need
+from it with ``FileManifest.select`` (see ``get_manifest``), instead of walking
+the config again. Files added to the config after ``assemble`` must be added
+to the table too (see ``FileManifest.add`` and
+``compute.all_files_to_copy_append``).
+"""
+
+
+class FileEntry:
+    """
+    One file of the experiment. ``source``, ``intermediate`` and ``target``
+    are ``None`` if the file has no such entry in the config, and ``movement`` is
+    only set when the manifest is built for a specific direction.
+    """
+
+    __slots__ = (
+        "model",
+        "filetype",
+        "category",
+        "source",
+        "intermediate",
+        "target",
+        "movement",
+    )
+
+    def __init__(
+        self,
+        model,
+        filetype,
+        category,
+        source,
+        intermediate=None,
+        target=None,
+        movement=None,
+    ):
+        self.model = model
+        self.filetype = filetype
+        self.category = category
+        self.source = source
+        self.intermediate = intermediate
+        self.target = target
+        self.movement = movement
+
+    def get(self, block):
+        """
+        Returns the path of the entry that corresponds to the name of the
+        config ``block`` (``sources``, ``intermediate`` or ``targets``).
+        """
+        if block == "sources":
+            return self.source
+        elif block == "intermediate":
+            return self.intermediate
+        elif block == "targets":
+            return self.target
+        raise KeyError(block)
+
+    def __repr__(self):
+        return (
+            f"FileEntry({self.model}, {self.filetype}, {self.category}, "
+            f"{self.source}, {self.intermediate}, {self.target}, {self.movement})"
+        )
+
+
+# Blocks of the file dictionaries, and their suffix in the config
+BLOCKS = {"sources": "_sources", "intermediate": "_intermediate", "targets": "_targets"}
+
+
+class FileManifest(list):
+    """
+    A list of ``FileEntry`` objects, one per file. The order of the entries is
+    the order in which ``copy_files`` and ``log_used_files`` have always
+    processed the files: file types first, then models, then categories.
+
+    ``self.blocks`` keeps the ``(model, filetype)`` pairs for which the config
+    contains the requested block, even if the block is empty.
+
+    A manifest built with ``build`` contains every file of the config, and can
+    be narrowed down to some file types and one block with ``select``.
+    """
+
+    def __init__(self, entries=(), blocks=()):
+        super().__init__(entries)
+        self.blocks = list(blocks)
+        # Categories of each block, in the order of the config, by
+        # ``(model, filetype, block)``
+        self._categories = {}
+        # Entries by ``(model, filetype, category)``
+        self._entries = {}
+
+    @classmethod
+    def build(cls, config):
+        """
+        Builds the manifest of all the files of ``config``, in a single pass
+        over the keys of every model.
+
+        Parameters
+        ----------
+        config : dict
+            The experiment configuration, after ``filelists.assemble``
+
+        Returns
+        -------
+        manifest : FileManifest
+        """
+        manifest = cls()
+        for model in config["general"]["valid_model_names"] + ["general"]:
+            for key, files in config.get(model, {}).items():
+                if not isinstance(files, dict):
+                    continue
+                for block, suffix in BLOCKS.items():
+                    if key.endswith(suffix):
+                        manifest.add_block(
+                            model, key[: -len(suffix)], block, files
+                        )
+                        break
+        return manifest
+
+    def add_block(self, model, filetype, block, files):
+        """
+        Adds (or replaces) the ``block`` of ``filetype`` of ``model``, with the
+        paths of the dictionary ``files``.
+        """
+        self._categories[(model, filetype, block)] = list(files)
+        for category, path in files.items():
+            self.add(model, filetype, category, **{block: path})
+
+    def add(self, model, filetype, category, sources=None, intermediate=None, targets=None):
+        """
+        Adds a file to the manifest, or updates the paths of an existing one.
+        Only the paths given are changed.
+        """
+        entry = self._entries.get((model, filetype, category))
+        if not entry:
+            entry = FileEntry(model, filetype, category, None)
+            self._entries[(model, filetype, category)] = entry
+            self.append(entry)
+        for block, path in [
+            ("sources", sources),
+            ("intermediate", intermediate),
+            ("targets", targets),
+        ]:
+            if not path:
+                continue
+            categories = self._categories.setdefault((model, filetype, block), [])
+            if entry.get(block) is None and category not in categories:
+                categories.append(category)
+            if block == "sources":
+                entry.source = path
+            elif block == "intermediate":
+                entry.intermediate = path
+            else:
+                entry.target = path
+
+    def select(self, config, filetypes, key="sources", movement=None):
+        """
+        Returns the manifest of the files of ``filetypes`` that have an entry
+        in the ``key`` block.
+
+        Parameters
+        ----------
+        config : dict
+            The experiment configuration the manifest was built from
+        filetypes : list
+            File types to include. ``ignore`` is included only if listed.
+        key : str
+            Name of the block (``sources``, ``intermediate`` or ``targets``) that
+            defines which files exist. Entries are selected for every category
+            of ``<filetype>_<key>``.
+        movement : callable, optional
+            Function ``movement(model, category, filetype)`` returning the name
+            of the file movement for the entry.
+
+        Returns
+        -------
+        manifest : FileManifest
+        """
+        selected = FileManifest()
+        models = config["general"]["valid_model_names"] + ["general"]
+        for filetype in filetypes:
+            for model in models:
+                categories = self._categories.get((model, filetype, key))
+                if categories is None:
+                    continue
+                selected.blocks.append((model, filetype))
+                for category in categories:
+                    entry = self._entries[(model, filetype, category)]
+                    if movement:
+                        entry = FileEntry(
+                            model,
+                            filetype,
+                            category,
+                            entry.source,
+                            entry.intermediate,
+                            entry.target,
+                            movement(model, category, filetype),
+                        )
+                    selected.append(entry)
+        return selected
+
+    @classmethod
+    def from_config(cls, config, filetypes, key="sources", movement=None):
+        """
+        Builds the manifest of ``config`` and selects ``filetypes`` and ``key``
+        from it (see ``build`` and ``select``), for configs that are not
+        assembled by ``filelists.assemble``.
+        """
+        return cls.build(config).select(config, filetypes, key, movement)
+
+    def by_model(self):
+        """
+        Returns a dictionary with the entries of each model, keeping their order.
+        """
+        grouped = {}
+        for entry in self:
+            grouped.setdefault(entry.model, []).append(entry)
+        return grouped
+
+
+def get_manifest(config):
+    """
+    Returns the manifest kept in ``general.file_manifest`` by
+    ``filelists.assemble``, building it if there is none.
+    """
+    manifest = config["general"].get("file_manifest")
+    if manifest is None:
+        manifest = FileManifest.build(config)
+        config["general"]["file_manifest"] = manifest
+    return manifest
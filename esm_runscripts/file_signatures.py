@@ -0,0 +1,219 @@
+"""
+Persistent record of the files staged by ``esm_runscripts``, used to decide
+whether a target file is still identical to its source without reading both
+files in full (as ``filecmp.cmp`` does when the stat signatures differ).
+
+For every staged ``target`` the record stores the stat signature (size,
+modification time and inode) of the source and of the target, together with a
+hash of the beginning and the end of the target content. If neither of the two
+files changed since they were recorded, they are considered identical. The hash
+is only used to prove that a source has changed; it is never used to declare two
+files identical.
+
+The record lives in ``<experiment_log_dir>/<expid>_file_signatures.jsonl``, one
+JSON entry per line. New entries are appended at the end of each ``copy_files``
+call, so the record survives from one chunk to the next. Targets inside of run
+folders are recorded under their path relative to the run folder (see
+``record_key``), so the entry of a file staged for the next chunk replaces the
+one of the previous chunk instead of adding to the record. Later lines override
+earlier lines for the same key, and the file is compacted once it contains too
+many outdated lines, leaving out the entries whose target does not exist
+anymore.
+"""
+import hashlib
+import json
+import os
+import re
+
+# Number of bytes read from the beginning and the end of a file for the hash
+SAMPLE_SIZE = 1024 * 1024
+
+# Already loaded records, by path, so that they are shared between the calls
+# to ``copy_files`` and ``copy_all_results_to_exp`` of one job
+_loaded_signatures = {}
+
+# Run folder part of a target path, i.e. ``/run_20000101-20001231/``
+_run_folder = re.compile(r"/run_[^/]+/")
+
+
+def record_key(target):
+    """
+    Returns the key of ``target`` in the record: its path, with the run
+    folder replaced by ``run_*`` for targets inside of a run folder.
+    """
+    return _run_folder.sub("/run_*/", target, count=1)
+
+
+def stat_signature(path):
+    """
+    Returns ``[size, mtime_ns, inode]`` of ``path`` (following symlinks), or
+    ``None`` if the file does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+def sampled_hash(path):
+    """
+    Hashes the size, the first and the last ``SAMPLE_SIZE`` bytes of ``path``.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as hashed_file:
+        size = os.fstat(hashed_file.fileno()).st_size
+        digest.update(str(size).encode())
+        digest.update(hashed_file.read(SAMPLE_SIZE))
+        if size > SAMPLE_SIZE:
+            if size > 2 * SAMPLE_SIZE:
+                hashed_file.seek(size - SAMPLE_SIZE)
+            digest.update(hashed_file.read(SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+def make_entry(source, target):
+    """
+    Creates the record entry for an identical ``source`` and ``target`` pair.
+    Returns ``None`` if any of the two files does not exist (i.e. after a
+    ``move``).
+    """
+    source_stat = stat_signature(source)
+    target_stat = stat_signature(target)
+    if not source_stat or not target_stat:
+        return None
+    try:
+        target_hash = sampled_hash(target)
+    except OSError:
+        return None
+    return {
+        "target": target,
+        "source": source,
+        "source_stat": source_stat,
+        "target_stat": target_stat,
+        "hash": target_hash,
+    }
+
+
+def compare(entry, source, target):
+    """
+    Compares ``source`` and ``target`` using the recorded ``entry``.
+
+    Returns
+    -------
+    identical : bool or None
+        ``True`` if both files are unchanged since they were recorded as
+        identical, ``False`` if the source is known to differ from the target
+        and ``None`` if the record cannot tell (the caller needs to compare the
+        files itself).
+    """
+    if not entry or entry["source"] != source or entry["target"] != target:
+        return None
+    target_stat = stat_signature(target)
+    if target_stat != entry["target_stat"]:
+        return None
+    source_stat = stat_signature(source)
+    if source_stat == entry["source_stat"]:
+        return True
+    if not source_stat:
+        return None
+    if source_stat[0] != target_stat[0]:
+        return False
+    try:
+        if sampled_hash(source) != entry["hash"]:
+            return False
+    except OSError:
+        pass
+    return None
+
+
+class FileSignatures:
+    """
+    The record of staged files of one experiment. Entries are read once and
+    kept in memory; ``update`` adds entries and ``save`` appends them to the
+    file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._new_entries = []
+        self._lines = 0
+        self.load()
+
+    def load(self):
+        """
+        Reads the record file, if it exists. Corrupted lines (e.g. from a job
+        that was killed while writing) are ignored.
+        """
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, "r") as record:
+            for line in record:
+                self._lines += 1
+                try:
+                    entry = json.loads(line)
+                    self.entries[record_key(entry["target"])] = entry
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+    def get(self, target):
+        """
+        Returns the entry of ``target``, or ``None`` if there is none (or only
+        one for the same file of another run folder).
+        """
+        entry = self.entries.get(record_key(target))
+        if entry and entry["target"] == target:
+            return entry
+        return None
+
+    def update(self, entry):
+        if entry:
+            self.entries[record_key(entry["target"])] = entry
+            self._new_entries.append(entry)
+
+    def save(self):
+        """
+        Appends the new entries to the record file in a single write. If the
+        file has grown much larger than the number of targets it describes, it
+        is rewritten instead.
+        """
+        if not self._new_entries:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if self._lines + len(self._new_entries) > 2 * len(self.entries) + 1000:
+            self.entries = {
+                key: entry
+                for key, entry in self.entries.items()
+                if os.path.lexists(entry["target"])
+            }
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as record:
+                record.write(
+                    "".join(json.dumps(entry) + "\n" for entry in self.entries.values())
+                )
+            os.replace(tmp_path, self.path)
+            self._lines = len(self.entries)
+        else:
+            with open(self.path, "a") as record:
+                record.write(
+                    "".join(json.dumps(entry) + "\n" for entry in self._new_entries)
+                )
+            self._lines += len(self._new_entries)
+        self._new_entries = []
+
+
+def get_file_signatures(config):
+    """
+    Returns the ``FileSignatures`` of the experiment, or ``None`` if the user
+    switched them off with ``general.use_file_signatures: False``.
+    """
+    if not config["general"].get("use_file_signatures", True):
+        return None
+    path = os.path.join(
+        config["general"]["experiment_log_dir"],
+        f"{config['general']['expid']}_file_signatures.jsonl",
+    )
+    if path not in _loaded_signatures:
+        _loaded_signatures[path] = FileSignatures(path)
+    return _loaded_signatures[path]
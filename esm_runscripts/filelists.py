@@ -1,12 +1,15 @@
+import csv
 import datetime
+import io
+import json
 import os
 import sys
 import shutil
+import stat
 import filecmp
 import copy
 import time
 import six
-import glob
 
 import esm_parser
 
@@ -14,6 +17,10 @@ import f90nml
 import esm_tools
 import yaml
 
+from . import directory_index, file_signatures, helpers
+from .file_manifest import FileManifest, get_manifest
+
+
 def rename_sources_to_targets(config):
     # Purpose of this routine is to make sure that filetype_sources and
     # filetype_targets are set correctly, and _in_work is unset
@@ -247,12 +254,15 @@ def choose_needed_files(config):
 
 
 def globbing(config):
+    index = directory_index.shared_index
+    patterns, listings, saved_calls = index.patterns, index.listings, index.saved_calls
     for filetype in config["general"]["all_model_filetypes"]:
         for model in config["general"]["valid_model_names"] + ["general"]:
             if filetype + "_sources" in config[model]:
-                oldconf = copy.deepcopy(config[model])
-                for descr, filename in six.iteritems(
-                    oldconf[filetype + "_sources"]
+                # Iterate over a snapshot of the items, as the sources are
+                # modified inside of the loop
+                for descr, filename in list(
+                    config[model][filetype + "_sources"].items()
                 ):  # * only in targets if denotes subfolder
                     if "*" in filename:
                         del config[model][filetype + "_sources"][descr]
@@ -264,7 +274,7 @@ def globbing(config):
                         config[model][filetype + "_sources_wild_card"] = wild_card
                         # skip subdirectories in file list, otherwise they
                         # will be listed as missing files later on
-                        all_filenames = [f for f in glob.glob(filename) if not os.path.isdir(f)]
+                        all_filenames = index.glob(filename, skip_dirs=True)
                         running_index = 0
 
                         for new_filename in all_filenames:
@@ -285,6 +295,13 @@ def globbing(config):
                             running_index += 1
 
                         del config[model][filetype + "_targets"][descr]
+    if config["general"]["verbose"] and index.patterns > patterns:
+        print(
+            f"Wildcard expansion: {index.patterns - patterns} patterns, "
+            f"{index.listings - listings} directory listings, "
+            f"{index.saved_calls - saved_calls} metadata calls saved",
+            flush=True
+        )
     return config
 
 
@@ -658,137 +675,524 @@ def replace_year_placeholder(config):
     return config
 
 
+# Columns of the structured file manifest, see ``write_file_manifest``
+FILE_MANIFEST_FIELDS = [
+    "stage",
+    "model",
+    "filetype",
+    "category",
+    "source",
+    "intermediate",
+    "target",
+    "movement",
+    "status",
+    "size",
+    "duration",
+]
+
+
+def file_manifest_path(config):
+    """
+    Returns the path of the structured file manifest of the current run, or
+    ``None`` if ``general.file_manifest_format`` is set to ``False``. Valid
+    formats are ``jsonl`` (default) and ``csv``.
+    """
+    manifest_format = config["general"].get("file_manifest_format", "jsonl")
+    if not manifest_format:
+        return None
+    if manifest_format not in ["jsonl", "csv"]:
+        esm_parser.user_error(
+            "file_manifest_format",
+            f"``general.file_manifest_format`` is ``{manifest_format}``, but only "
+            "``jsonl``, ``csv`` or ``False`` are supported.",
+        )
+    return (
+        f"{config['general']['thisrun_config_dir']}"
+        f"/{config['general']['expid']}_filemanifest_"
+        f"{config['general']['run_datestamp']}.{manifest_format}"
+    )
+
+
+def reset_file_manifest(config):
+    """
+    Removes the structured file manifest left over from a previous attempt of
+    the current run, so that ``copy_files`` starts a new one. Only called by
+    the compute job, as the manifest of a run is extended by the later jobs of
+    the run (i.e. ``tidy``).
+    """
+    manifest_path = file_manifest_path(config)
+    if manifest_path and os.path.isfile(manifest_path):
+        os.remove(manifest_path)
+    return config
+
+
+def write_file_manifest(config, entries, results, stage):
+    """
+    Appends one row per moved file to the structured file manifest of the run
+    (see ``file_manifest_path``), with the paths and the movement of the
+    ``FileManifest`` entry, together with the status, the size in bytes and the
+    duration in seconds returned by ``move_one_file``. All rows of one
+    ``copy_files`` call are written at once.
+
+    Parameters
+    ----------
+    config : dict
+        The experiment configuration
+    entries : list
+        The ``FileEntry`` objects of the moved files
+    results : list
+        The return values of ``move_one_file`` for ``entries``
+    stage : str
+        Description of the movement, i.e. ``init->thisrun``
+    """
+    path = file_manifest_path(config)
+    if not path or not entries:
+        return
+    rows = []
+    for entry, (status, _, _, _, size, duration) in zip(entries, results):
+        rows.append(
+            {
+                "stage": stage,
+                "model": entry.model,
+                "filetype": entry.filetype,
+                "category": entry.category,
+                "source": entry.source,
+                "intermediate": entry.intermediate,
+                "target": entry.target,
+                "movement": entry.movement,
+                "status": status,
+                "size": size,
+                "duration": round(duration, 6),
+            }
+        )
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if path.endswith(".csv"):
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=FILE_MANIFEST_FIELDS)
+        if not os.path.isfile(path) or os.path.getsize(path) == 0:
+            writer.writeheader()
+        writer.writerows(rows)
+        content = buffer.getvalue()
+    else:
+        content = "".join(json.dumps(row) + "\n" for row in rows)
+    with open(path, "a") as manifest_file:
+        manifest_file.write(content)
+
+
 def log_used_files(config):
+    """
+    Writes the list of files used by each component into
+    ``<thisrun_config_dir>/<expid>_filelist_<run_datestamp>``. The text lists
+    can be switched off with ``general.log_used_files_text: False``, i.e. for
+    very large file lists, in which case the structured file manifest (see
+    ``write_file_manifest``) is the only record of the used files.
+    """
     if config["general"]["verbose"]:
         print("\n::: Logging used files", flush=True)
+    if not config["general"].get("log_used_files_text", True):
+        return config
+
     filetypes = config["general"]["relevant_filetypes"]
+    manifest = get_manifest(config).select(config, filetypes)
+    blocks = {block: [] for block in manifest.blocks}
+    for entry in manifest:
+        blocks[(entry.model, entry.filetype)].append(entry)
     for model in config["general"]["valid_model_names"] + ["general"]:
         # this file contains the files used in the experiment
         flist_file = \
             f"{config[model]['thisrun_config_dir']}"\
             f"/{config['general']['expid']}_filelist_"\
             f"{config['general']['run_datestamp']}"
-        
+
+        lines = [
+            f"These files are used for \n" \
+            f"experiment {config['general']['expid']}\n" \
+            f"component {model}\n" \
+            f"date {config['general']['run_datestamp']}",
+            "\n",
+            80 * "-",
+        ]
+        for filetype in filetypes:
+            if (model, filetype) in blocks:
+                lines.append("\n" + filetype.upper() + ":\n")
+                for entry in blocks[(model, filetype)]:
+                    lines.append("\nSource: " + entry.source)
+                    lines.append("\nExp Tree: " + entry.intermediate)
+                    lines.append("\nTarget: " + entry.target)
+                    if config["general"]["verbose"]:
+                        print(flush=True)
+                        print(f'- source: {entry.source}', flush=True)
+                        print(f'- target: {entry.target}', flush=True)
+                        print(datetime.datetime.now(), flush=True)
+                    lines.append("\n")
+            lines.append("\n")
+            lines.append(80 * "-")
         with open(flist_file, "w") as flist:
-            flist.write(
-                f"These files are used for \n" \
-                f"experiment {config['general']['expid']}\n" \
-                f"component {model}\n" \
-                f"date {config['general']['run_datestamp']}"
-                )
-            flist.write("\n")
-            flist.write(80 * "-")
-            for filetype in filetypes:
-                if filetype + "_sources" in config[model]:
-                    flist.write("\n" + filetype.upper() + ":\n")
-                    for category in config[model][filetype + "_sources"]:
-#                        esm_parser.pprint_config(config[model])
-                        flist.write(
-                            "\nSource: "
-                            + config[model][filetype + "_sources"][category]
-                        )
-                        flist.write(
-                            "\nExp Tree: "
-                            + config[model][filetype + "_intermediate"][category]
-                        )
-                        flist.write(
-                            "\nTarget: "
-                            + config[model][filetype + "_targets"][category]
-                        )
-                        if config["general"]["verbose"]:
-                            print(flush=True)
-                            print((f'- source: '
-                                f'{config[model][filetype + "_sources"][category]}'), flush=True)
-                            print((f'- target: '
-                                f'{config[model][filetype + "_targets"][category]}'), flush=True)
-                            print(datetime.datetime.now(), flush=True)
-                        flist.write("\n")
-                flist.write("\n")
-                flist.write(80 * "-")
+            flist.write("".join(lines))
     return config
 
 
-def check_for_unknown_files(config):
-    # files = os.listdir(config["general"]["thisrun_work_dir"])
-    all_files = glob.iglob(
-        config["general"]["thisrun_work_dir"] + "**/*", recursive=True
-    )
+def scan_work_dir(work_dir, claimed):
+    """
+    Walks ``work_dir`` with ``os.scandir`` and yields ``(path, realpath)`` for
+    every file and directory in it, like ``glob.iglob(work_dir + "**/*",
+    recursive=True)`` would (hidden entries are left out, symlinked directories
+    are followed). Each path is resolved only once: entries that are not
+    symlinks inherit the resolved path of their directory.
+
+    Directories whose resolved path is in ``claimed`` are yielded but not
+    entered, as their content belongs to a known file entry. Directories that
+    were already visited through another path (symlink loops) are not entered
+    again.
+
+    Parameters
+    ----------
+    work_dir : str
+        Directory to be scanned
+    claimed : set
+        Resolved paths of the known files
+    """
+    work_dir_real = os.path.realpath(work_dir)
+    visited = {work_dir_real}
+    stack = [(work_dir, work_dir_real)]
+    while stack:
+        directory, directory_real = stack.pop()
+        try:
+            with os.scandir(directory) as scanned:
+                entries = list(scanned)
+        except OSError:
+            continue
+        subdirectories = []
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            try:
+                is_symlink = entry.is_symlink()
+                is_dir = entry.is_dir()
+            except OSError:
+                is_symlink, is_dir = True, False
+            if is_symlink:
+                entry_real = os.path.realpath(entry.path)
+            else:
+                entry_real = os.path.join(directory_real, entry.name)
+            yield entry.path, entry_real
+            if is_dir and entry_real not in claimed and entry_real not in visited:
+                visited.add(entry_real)
+                subdirectories.append((entry.path, entry_real))
+        # Reversed, so that the subdirectories are popped in listing order
+        stack.extend(reversed(subdirectories))
+
 
+def check_for_unknown_files(config):
     known_files = [
         config["general"]["thisrun_work_dir"] + "/" + "hostfile_srun",
         config["general"]["thisrun_work_dir"] + "/" + "namcouple",
         config["general"]["thisrun_work_dir"] + "/" + "coupling.xml",
     ]
 
-    for filetype in config["general"]["all_model_filetypes"]:
-        for model in config["general"]["valid_model_names"] + ["general"]:
-            if filetype + "_sources" in config[model]:
-                known_files += list(config[model][filetype + "_sources"].values())
-                known_files += list(config[model][filetype + "_targets"].values())
+    for entry in get_manifest(config).select(
+        config, config["general"]["all_model_filetypes"]
+    ):
+        if entry.source:
+            known_files.append(entry.source)
+        if entry.target:
+            known_files.append(entry.target)
 
-    known_files = [os.path.realpath(known_file) for known_file in known_files]
-    known_files = list(dict.fromkeys(known_files))
+    known_files = {os.path.realpath(known_file) for known_file in known_files}
 
     if not "unknown_sources" in config["general"]:
         config["general"]["unknown_sources"] = {}
         config["general"]["unknown_targets"] = {}
         config["general"]["unknown_intermediate"] = {}
 
-    unknown_files = []
+    work_dir_real = os.path.realpath(config["general"]["thisrun_work_dir"])
+    experiment_unknown_dir_real = os.path.realpath(
+        config["general"]["experiment_unknown_dir"]
+    )
+    thisrun_unknown_dir_real = os.path.realpath(
+        config["general"]["thisrun_unknown_dir"]
+    )
+
+    unknown_files = set()
     index = 0
 
-    for thisfile in all_files:
+    for thisfile, thisfile_real in scan_work_dir(
+        config["general"]["thisrun_work_dir"], known_files
+    ):
 
-        if os.path.realpath(thisfile) in known_files + unknown_files:
+        if thisfile_real in known_files or thisfile_real in unknown_files:
             continue
-        config["general"]["unknown_sources"][index] = os.path.realpath(thisfile)
-        config["general"]["unknown_targets"][index] = os.path.realpath(
-            thisfile
-        ).replace(
-            os.path.realpath(config["general"]["thisrun_work_dir"]),
-            os.path.realpath(config["general"]["experiment_unknown_dir"]),
+        config["general"]["unknown_sources"][index] = thisfile_real
+        config["general"]["unknown_targets"][index] = thisfile_real.replace(
+            work_dir_real, experiment_unknown_dir_real
         )
-        config["general"]["unknown_intermediate"][index] = os.path.realpath(
-            thisfile
-        ).replace(
-            os.path.realpath(config["general"]["thisrun_work_dir"]),
-            os.path.realpath(config["general"]["thisrun_unknown_dir"]),
+        config["general"]["unknown_intermediate"][index] = thisfile_real.replace(
+            work_dir_real, thisrun_unknown_dir_real
         )
 
-        unknown_files.append(os.path.realpath(thisfile))
+        unknown_files.add(thisfile_real)
 
         index += 1
-        print("Unknown file in work: " + os.path.realpath(thisfile), flush=True)
+        print("Unknown file in work: " + thisfile_real, flush=True)
         print(datetime.datetime.now(), flush=True)
 
+    manifest = get_manifest(config)
+    for block in ["sources", "intermediate", "targets"]:
+        manifest.add_block(
+            "general", "unknown", block, config["general"][f"unknown_{block}"]
+        )
     return config
 
 
+# Resolved paths of the symlinks (and of the directories containing them) seen
+# by ``resolve_symlinks`` in this process. ``None`` marks links that are part of
+# a cycle. Shared by ``copy_files`` and ``tidy.copy_all_results_to_exp``, which
+# both empty it when they start, as links (e.g. ``restart.nc`` of the restart
+# folders) are replaced between their calls.
+_symlink_cache = {}
+_symlink_cache_stats = {"hits": 0, "misses": 0, "cycles": 0}
+
+
+def _cached_realpath(path):
+    if path in _symlink_cache:
+        _symlink_cache_stats["hits"] += 1
+        return _symlink_cache[path]
+    _symlink_cache_stats["misses"] += 1
+    resolved = os.path.realpath(path)
+    _symlink_cache[path] = resolved
+    return resolved
+
+
+def _resolve_symlink_chain(path):
+    """
+    Follows the symlink ``path`` one link at a time, so that chains shared by
+    several links are only resolved once. Returns the fully resolved path, or
+    ``None`` if the chain ends in a cycle.
+    """
+    chain = []
+    seen = set()
+    current = path
+    while True:
+        if current in _symlink_cache:
+            _symlink_cache_stats["hits"] += 1
+            resolved = _symlink_cache[current]
+            break
+        _symlink_cache_stats["misses"] += 1
+        if current in seen:
+            _symlink_cache_stats["cycles"] += 1
+            resolved = None
+            break
+        seen.add(current)
+        chain.append(current)
+        if not os.path.islink(current):
+            # Resolves links in the directory part of the path
+            resolved = os.path.realpath(current)
+            break
+        try:
+            link_target = os.readlink(current)
+        except OSError:
+            resolved = os.path.realpath(current)
+            break
+        # Relative link targets are relative to the real directory of the link.
+        # ``..`` is left to the filesystem, as it depends on the real path of the
+        # components in front of it
+        parent = _cached_realpath(os.path.dirname(os.path.abspath(current)))
+        current = os.path.join(parent, link_target)
+        if ".." not in link_target.split("/"):
+            current = os.path.normpath(current)
+    for link in chain:
+        _symlink_cache[link] = resolved
+    return resolved
+
 
 def resolve_symlinks(file_source,verbose):
-    if os.path.islink(file_source):
-        points_to = os.path.realpath(file_source)
-
-        # deniz: check if file links to itself. In UNIX
-        # ln -s endless_link endless_link is a valid command
-        if os.path.abspath(file_source) == points_to:
-            if verbose:
-                print(f"file {file_source} links to itself", flush=True)
-                print(datetime.datetime.now(), flush=True)
-            return file_source
+    """
+    Returns the file ``file_source`` points to, following the whole chain of
+    symlinks, or ``file_source`` itself if it is not a symlink or if it is part
+    of a symlink cycle (e.g. ``ln -s endless_link endless_link``). Resolutions
+    are cached for the whole process, see ``symlink_cache_info``.
+    """
+    if not os.path.islink(file_source):
+        return file_source
 
-        # recursively find the file that the link is pointing to
-        return resolve_symlinks(points_to,verbose)
-    else:
-        return(file_source)
+    points_to = _resolve_symlink_chain(file_source)
+    if points_to is None:
+        if verbose:
+            print(f"file {file_source} links to itself", flush=True)
+            print(datetime.datetime.now(), flush=True)
+        return file_source
+    return points_to
+
+
+def symlink_cache_info():
+    """
+    Returns the number of ``hits``, ``misses`` and ``cycles`` found so far by
+    the symlink resolution cache, together with its ``size``.
+    """
+    info = dict(_symlink_cache_stats)
+    info["size"] = len(_symlink_cache)
+    return info
 
 
+def clear_symlink_cache():
+    """
+    Empties the symlink resolution cache, i.e. if links were changed.
+    """
+    _symlink_cache.clear()
+    for key in _symlink_cache_stats:
+        _symlink_cache_stats[key] = 0
+
+
+def file_movement_workers(config):
+    """
+    Reads the number of concurrent file movements and the type of pool used for
+    them from ``general.file_movement_workers`` (default ``1``, serial) and
+    ``general.file_movement_pool`` (``thread``, default, or ``process``).
+
+    Parameters
+    ----------
+    config : dict
+        The experiment configuration
+
+    Returns
+    -------
+    workers : int
+    pool : str
+    """
+    workers = config["general"].get("file_movement_workers", 1)
+    pool = config["general"].get("file_movement_pool", "thread")
+    try:
+        workers = int(workers)
+        assert workers >= 1
+    except (TypeError, ValueError, AssertionError):
+        esm_parser.user_error(
+            "file_movement_workers",
+            "'general.file_movement_workers' needs to be an integer greater or "
+            + f"equal than 1, but '{workers}' was given."
+        )
+    if pool not in ["thread", "process"]:
+        esm_parser.user_error(
+            "file_movement_pool",
+            "'general.file_movement_pool' can only be 'thread' or 'process', but "
+            + f"'{pool}' was given."
+        )
+    return workers, pool
+
+
+def move_one_file(
+    file_source, file_target, movement_method, verbose, known=None, record=False
+):
+    """
+    Moves a single file with ``movement_method``, unless ``file_source`` does not
+    exist or ``file_target`` is already identical to it. This is the unit of
+    work of ``copy_files`` and can run in a thread or process pool.
+
+    Parameters
+    ----------
+    file_source : str
+    file_target : str
+    movement_method : callable
+    verbose : bool
+    known : dict or None
+        Entry of the file signatures record for ``file_target``, if any. It is
+        used to decide whether the files are identical without comparing them.
+    record : bool
+        If ``True`` a new record entry is returned for the identical or moved
+        file.
+
+    Returns
+    -------
+    status : str
+        ``"success"``, ``"missing"`` or ``"skipped"``
+    file_source : str
+    file_target : str
+    entry : dict or None
+        New entry for the file signatures record
+    size : int or None
+        Size of ``file_source`` in bytes
+    duration : float
+        Seconds spent on the comparison and the movement of the file
+    """
+    start = time.perf_counter()
+    size = None
+    dest_dir = os.path.dirname(file_target)
+    try:
+        # MA: ``os.makedirs`` creates the specified directory
+        # and the parent directories if the last don't exist
+        # (same as with ``mkdir -p <directory>>``)
+        os.makedirs(dest_dir, exist_ok=True)
+        if not os.path.isfile(file_source):
+            print(f"WARNING: File not found: {file_source}", flush=True)
+            print(datetime.datetime.now(), flush=True)
+            return "missing", file_source, file_target, None, size, 0.0
+        size = os.path.getsize(file_source)
+        if os.path.isfile(file_target):
+            identical = file_signatures.compare(known, file_source, file_target)
+            recorded = identical is True
+            if identical is None:
+                identical = filecmp.cmp(file_source, file_target)
+            if identical:
+                if verbose:
+                    print(
+                        f"Source and target file are identical, skipping {file_source}",
+                        flush=True
+                    )
+                    print(datetime.datetime.now(), flush=True)
+                entry = None
+                if record and not recorded:
+                    entry = file_signatures.make_entry(file_source, file_target)
+                duration = time.perf_counter() - start
+                return "skipped", file_source, file_target, entry, size, duration
+        movement_method(file_source, file_target)
+        duration = time.perf_counter() - start
+        entry = None
+        if record:
+            entry = file_signatures.make_entry(file_source, file_target)
+        return "success", file_source, file_target, entry, size, duration
+    except IOError:
+        print(
+            f"Could not copy {file_source} to {file_target} for unknown reasons.",
+            flush=True
+        )
+        print(datetime.datetime.now(), flush=True)
+        return "missing", file_source, file_target, None, size, 0.0
+
 
 def copy_files(config, filetypes, source, target):
+    """
+    Moves the files of ``filetypes`` from ``source`` to ``target`` (``init``,
+    ``thisrun`` or ``work``), using the movement method defined in
+    ``file_movements`` for each file.
+
+    The movements are run concurrently if ``general.file_movement_workers`` is
+    larger than 1 (see ``file_movement_workers``). Targets that were already
+    staged in a previous call are recognised through the experiment's file
+    signatures record (see ``file_signatures.py``) instead of being compared
+    byte by byte. Files that could not be found are added to
+    ``general.files_missing_when_preparing_run``.
+
+    Parameters
+    ----------
+    config : dict
+        The experiment configuration
+    filetypes : list
+        File types to be moved
+    source : str
+        Where the files come from
+    target : str
+        Where the files go to
+
+    Returns
+    -------
+    config : dict
+    """
     if config["general"]["verbose"]:
         print("\n::: Copying files", flush=True)
         print(datetime.datetime.now(), flush=True)
 
+    # Links may have been changed since the last call
+    clear_symlink_cache()
+
     successful_files = []
     missing_files = {}
 
@@ -804,65 +1208,71 @@ def copy_files(config, filetypes, source, target):
     elif target == "work":
         text_target = "targets"
 
+    signatures = file_signatures.get_file_signatures(config)
 
-    for filetype in [filetype for filetype in filetypes if not filetype == "ignore"]:
-        for model in config["general"]["valid_model_names"] + ["general"]:
-            if filetype + "_" + text_source in config[model]:
-                sourceblock = config[model][filetype + "_" + text_source]
-                targetblock = config[model][filetype + "_" + text_target]
-                for categ in sourceblock:
-                    movement_method = get_method(
-                        get_movement(config, model, categ, filetype, source, target)
-                    )
-                    file_source = os.path.normpath(sourceblock[categ])
-                    file_target = os.path.normpath(targetblock[categ])
-                    if config["general"]["verbose"]:
-                        print(flush=True)
-                        print(f"- source: {file_source}", flush=True)
-                        print(f"- target: {file_target}", flush=True)
-                        print(datetime.datetime.now(), flush=True)
-                    if file_source == file_target:
-                        if config["general"]["verbose"]:
-                            print(
-                                f"Source and target paths are identical, skipping {file_source}",
-                                flush=True
-                            )
-                            print(datetime.datetime.now(), flush=True)
-                        continue
-                    dest_dir = os.path.dirname(file_target)
-                    file_source = resolve_symlinks(file_source,config["general"]["verbose"])
-                    if not os.path.isdir(file_source):
-                        try:
-                            if not os.path.isdir(dest_dir):
-                                # MA: ``os.makedirs`` creates the specified directory
-                                # and the parent directories if the last don't exist
-                                # (same as with ``mkdir -p <directory>>``)
-                                os.makedirs(dest_dir)
-                            if not os.path.isfile(file_source):
-                                print(f"WARNING: File not found: {file_source}", flush=True)
-                                print(datetime.datetime.now(), flush=True)
-                                missing_files.update({file_target: file_source})
-                                continue
-                            if os.path.isfile(file_target) and filecmp.cmp(
-                                file_source, file_target
-                            ):
-                                if config["general"]["verbose"]:
-                                    print(
-                                        f"Source and target file are identical, skipping {file_source}",
-                                        flush=True
-                                    )
-                                    print(datetime.datetime.now(), flush=True)
-                                continue
-                            movement_method(file_source, file_target)
-                            #shutil.copy2(file_source, file_target)
-                            successful_files.append(file_source)
-                        except IOError:
-                            print(
-                                f"Could not copy {file_source} to {file_target} for unknown reasons.",
-                                flush=True
-                            )
-                            print(datetime.datetime.now(), flush=True)
-                            missing_files.update({file_target: file_source})
+    manifest = get_manifest(config).select(
+        config,
+        [filetype for filetype in filetypes if not filetype == "ignore"],
+        key=text_source,
+        movement=lambda model, categ, filetype: get_movement(
+            config, model, categ, filetype, source, target
+        ),
+    )
+
+    file_movements = []
+    moved_entries = []
+    for entry in manifest:
+        movement_method = get_method(entry.movement)
+        file_source = os.path.normpath(entry.get(text_source))
+        file_target = os.path.normpath(entry.get(text_target))
+        if config["general"]["verbose"]:
+            print(flush=True)
+            print(f"- source: {file_source}", flush=True)
+            print(f"- target: {file_target}", flush=True)
+            print(datetime.datetime.now(), flush=True)
+        if file_source == file_target:
+            if config["general"]["verbose"]:
+                print(
+                    f"Source and target paths are identical, skipping {file_source}",
+                    flush=True
+                )
+                print(datetime.datetime.now(), flush=True)
+            continue
+        file_source = resolve_symlinks(file_source,config["general"]["verbose"])
+        if not os.path.isdir(file_source):
+            file_movements.append(
+                (
+                    file_source,
+                    file_target,
+                    movement_method,
+                    config["general"]["verbose"],
+                    signatures.get(file_target) if signatures else None,
+                    signatures is not None,
+                )
+            )
+            moved_entries.append(entry)
+
+    if config["general"]["verbose"]:
+        print(f"Symlink resolution cache: {symlink_cache_info()}", flush=True)
+
+    workers, pool = file_movement_workers(config)
+    if config["general"]["verbose"] and workers > 1:
+        print(
+            f"Moving {len(file_movements)} files with {workers} {pool} workers",
+            flush=True
+        )
+    results = helpers.map_concurrently(move_one_file, file_movements, workers, pool)
+    write_file_manifest(config, moved_entries, results, f"{source}->{target}")
+    record_throughput(config, moved_entries, results)
+    for status, file_source, file_target, entry, size, duration in results:
+        if status == "success":
+            successful_files.append(file_source)
+        elif status == "missing":
+            missing_files.update({file_target: file_source})
+        if signatures:
+            signatures.update(entry)
+    if signatures:
+        signatures.save()
 
     if missing_files:
         if not "files_missing_when_preparing_run" in config["general"]:
@@ -877,6 +1287,242 @@ def copy_files(config, filetypes, source, target):
     return config
 
 
+def throughput_path(config):
+    """
+    Returns the path of the record of measured staging throughput, which is
+    kept per movement method in ``<experiment_log_dir>/<expid>_staging_throughput.json``.
+    """
+    return os.path.join(
+        config["general"]["experiment_log_dir"],
+        f"{config['general']['expid']}_staging_throughput.json",
+    )
+
+
+def load_throughput(config):
+    """
+    Returns the measured throughput as a dictionary ``{movement: {"bytes": ...,
+    "seconds": ..., "files": ...}}``, or an empty dictionary if nothing was
+    measured yet.
+    """
+    try:
+        with open(throughput_path(config), "r") as record:
+            return json.load(record)
+    except (OSError, ValueError):
+        return {}
+
+
+def record_throughput(config, entries, results):
+    """
+    Adds the bytes and seconds spent on the files moved by ``copy_files`` to the
+    throughput record of the experiment (see ``throughput_path``), so that
+    ``plan_file_movements`` can estimate how long the staging will take.
+    """
+    measured = {}
+    for entry, (status, _, _, _, size, duration) in zip(entries, results):
+        if status != "success" or size is None:
+            continue
+        totals = measured.setdefault(
+            entry.movement, {"bytes": 0, "seconds": 0.0, "files": 0}
+        )
+        totals["bytes"] += size
+        totals["seconds"] += duration
+        totals["files"] += 1
+    if not measured:
+        return
+    throughput = load_throughput(config)
+    for movement, totals in measured.items():
+        recorded = throughput.setdefault(
+            movement, {"bytes": 0, "seconds": 0.0, "files": 0}
+        )
+        for key in totals:
+            recorded[key] += totals[key]
+    path = throughput_path(config)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as record:
+            json.dump(throughput, record)
+    except OSError:
+        pass
+
+
+def _mount_point(path):
+    path = os.path.realpath(path)
+    while not os.path.ismount(path):
+        path = os.path.dirname(path)
+    return path
+
+
+def _stat_source(file_source, verbose):
+    """
+    Returns ``(resolved_source, size, device)`` for a source of the staging
+    plan, ``size`` being ``None`` for missing files and ``device`` ``None``
+    for directories, which ``copy_files`` skips as well.
+    """
+    resolved = resolve_symlinks(file_source, verbose)
+    try:
+        source_stat = os.stat(resolved)
+    except OSError:
+        return resolved, None, None
+    if stat.S_ISDIR(source_stat.st_mode):
+        return resolved, 0, None
+    return resolved, source_stat.st_size, source_stat.st_dev
+
+
+def _format_size(size):
+    for unit in ["B", "kB", "MB", "GB", "TB"]:
+        if size < 1024 or unit == "TB":
+            return f"{size:.2f} {unit}"
+        size = size / 1024.
+
+
+def _format_duration(seconds):
+    return str(datetime.timedelta(seconds=round(seconds)))
+
+
+def plan_file_movements(config, filetypes, source="init", target="thisrun"):
+    """
+    Dry run of ``copy_files(config, filetypes, source, target)`` and of the
+    following ``thisrun`` to ``work`` movement. All sources are stat'ed
+    concurrently (``general.file_plan_workers`` threads, 16 by default) before
+    any file is moved, and the plan is printed:
+
+    * the missing sources, which are also added to
+      ``general.files_missing_when_preparing_run`` right away, so that
+      ``report_missing_files`` lists them even if the copy is interrupted,
+    * the number of files and bytes per file type and per filesystem,
+    * the expected duration of each stage, estimated from the throughput
+      measured per movement method in previous calls of ``copy_files`` (see
+      ``record_throughput``).
+
+    The plan runs with ``-c`` (check) or if ``general.plan_file_movements`` is
+    ``True``.
+
+    Parameters
+    ----------
+    config : dict
+        The experiment configuration
+    filetypes : list
+        File types to be moved
+    source : str
+        Where the files come from
+    target : str
+        Where the files go to
+
+    Returns
+    -------
+    config : dict
+    """
+    text_source = "intermediate" if source == "thisrun" else "sources"
+    text_target = "intermediate" if target == "thisrun" else "targets"
+    stages = [(source, target)]
+    if target == "thisrun":
+        stages.append(("thisrun", "work"))
+
+    manifest = get_manifest(config).select(
+        config,
+        [filetype for filetype in filetypes if not filetype == "ignore"],
+        key=text_source,
+    )
+    planned = []
+    for entry in manifest:
+        file_source = entry.get(text_source)
+        file_target = entry.get(text_target)
+        if not file_source or not file_target:
+            continue
+        file_source = os.path.normpath(file_source)
+        file_target = os.path.normpath(file_target)
+        if file_source != file_target:
+            planned.append((entry, file_source, file_target))
+
+    workers = config["general"].get("file_plan_workers", 16)
+    stats = helpers.map_concurrently(
+        _stat_source,
+        [(file_source, False) for _, file_source, _ in planned],
+        workers,
+        "thread",
+    )
+
+    missing_files = {}
+    per_filetype = {}
+    per_device = {}
+    mount_points = {}
+    per_movement = {stage: {} for stage in stages}
+    for (entry, file_source, file_target), (resolved, size, device) in zip(
+        planned, stats
+    ):
+        if size is None:
+            missing_files[file_target] = resolved
+            continue
+        if device is None:
+            continue
+        counts = per_filetype.setdefault(entry.filetype, [0, 0])
+        counts[0] += 1
+        counts[1] += size
+        counts = per_device.setdefault(device, [0, 0])
+        counts[0] += 1
+        counts[1] += size
+        if device not in mount_points:
+            mount_points[device] = _mount_point(resolved)
+        for stage in stages:
+            if stage != stages[0] and not entry.target:
+                continue
+            try:
+                movement = get_movement(
+                    config, entry.model, entry.category, entry.filetype, *stage
+                )
+            except KeyError:
+                continue
+            counts = per_movement[stage].setdefault(movement, [0, 0])
+            counts[0] += 1
+            counts[1] += size
+
+    throughput = load_throughput(config)
+    print(f"\n::: Staging plan ({source} -> {target})", flush=True)
+    total_files = sum(counts[0] for counts in per_filetype.values())
+    total_size = sum(counts[1] for counts in per_filetype.values())
+    print(
+        f"{total_files} files, {_format_size(total_size)}, "
+        f"{len(missing_files)} missing",
+        flush=True,
+    )
+    print("Per file type:", flush=True)
+    for filetype, (files, size) in per_filetype.items():
+        print(f"    {filetype:<20} {files:>8} files {_format_size(size):>12}", flush=True)
+    print("Per filesystem:", flush=True)
+    for device, (files, size) in per_device.items():
+        print(
+            f"    {mount_points[device]:<20} {files:>8} files {_format_size(size):>12}",
+            flush=True,
+        )
+    print("Estimated duration:", flush=True)
+    for stage in stages:
+        estimate = 0.0
+        unknown = []
+        for movement, (files, size) in per_movement[stage].items():
+            measured = throughput.get(movement)
+            if not measured or not measured["files"]:
+                unknown.append(movement)
+            elif measured["bytes"]:
+                estimate += size * measured["seconds"] / measured["bytes"]
+            else:
+                estimate += files * measured["seconds"] / measured["files"]
+        line = f"    {stage[0]} -> {stage[1]}: {_format_duration(estimate)}"
+        if unknown:
+            line += f" (no throughput measured yet for: {', '.join(unknown)})"
+        print(line, flush=True)
+
+    if missing_files:
+        if "files_missing_when_preparing_run" not in config["general"]:
+            config["general"]["files_missing_when_preparing_run"] = {}
+        print("\nWARNING: These files are missing:", flush=True)
+        for missing_file in missing_files:
+            print(f'- missing source: {missing_files[missing_file]}', flush=True)
+            print(f'- missing target: {missing_file}', flush=True)
+        config["general"]["files_missing_when_preparing_run"].update(missing_files)
+    print(flush=True)
+    return config
+
+
 def report_missing_files(config):
     # this list is populated by the ``copy_files`` function in filelists.py
     config = _check_fesom_missing_files(config)
@@ -944,6 +1590,68 @@ def complete_one_file_movement(config, model, filetype, movement, movetype):
     return config
 
 
+# ioctl request to clone the extents of a file (``FICLONE`` in ``linux/fs.h``)
+FICLONE = 0x40049409
+
+
+def hardlink(file_source, file_target):
+    """
+    Creates a hard link ``file_target`` to ``file_source``. Falls back to
+    ``shutil.copy2`` if that is not possible (i.e. different filesystems or a
+    filesystem without hard links).
+
+    .. Warning:: As with ``link``, the target shares its content with the source,
+       so a model modifying the file in place also modifies the source.
+    """
+    try:
+        if os.path.lexists(file_target):
+            os.remove(file_target)
+        os.link(file_source, file_target)
+    except OSError:
+        shutil.copy2(file_source, file_target)
+
+
+def reflink(file_source, file_target):
+    """
+    Creates ``file_target`` as a copy-on-write clone of ``file_source``
+    (``FICLONE``, supported e.g. by Btrfs and XFS), so no data is copied until one
+    of the files is modified. Falls back to ``shutil.copy2`` if the filesystem
+    does not support it.
+    """
+    try:
+        import fcntl
+
+        with open(file_source, "rb") as source, open(file_target, "wb") as target:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        shutil.copystat(file_source, file_target)
+    except (ImportError, OSError):
+        shutil.copy2(file_source, file_target)
+
+
+def kernel_copy(file_source, file_target):
+    """
+    Copies ``file_source`` to ``file_target`` inside the kernel with
+    ``os.copy_file_range`` (Linux, Python >= 3.8), which avoids passing the data
+    through user space and allows server-side copies on network filesystems.
+    Falls back to ``shutil.copy2`` if that is not possible.
+    """
+    if not hasattr(os, "copy_file_range"):
+        shutil.copy2(file_source, file_target)
+        return
+    try:
+        with open(file_source, "rb") as source, open(file_target, "wb") as target:
+            remaining = os.fstat(source.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(source.fileno(), target.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+        if remaining > 0:
+            raise OSError(f"copy_file_range stopped before the end of {file_source}")
+        shutil.copystat(file_source, file_target)
+    except OSError:
+        shutil.copy2(file_source, file_target)
+
 
 def get_method(movement):
     if movement == "copy":
@@ -952,6 +1660,12 @@ def get_method(movement):
         return os.symlink
     elif movement == "move":
         return os.rename
+    elif movement == "hardlink":
+        return hardlink
+    elif movement == "reflink":
+        return reflink
+    elif movement == "copy_file_range":
+        return kernel_copy
     print("Unknown file movement type, using copy (safest option).", flush=True)
     return shutil.copy2
 
@@ -1082,10 +1796,14 @@ def assemble(config):
     config = complete_targets(config)
     config = complete_sources(config)
     config = reuse_sources(config)
+    # NOTE: Non top level import to avoid circular dependency
+    from . import prefetch
+    config = prefetch.remember_templates(config)
     config = replace_year_placeholder(config)
 
     config = complete_restart_in(config)
     config = globbing(config)
     config = target_subfolders(config)
     config = assemble_intermediate_files_and_finalize_targets(config)
+    config["general"]["file_manifest"] = FileManifest.build(config)
     return config
@@ -0,0 +1,368 @@
+"""
+Partial loading of ``<expid>_finished_config.yaml`` files.
+
+``PrevRunInfo`` only needs the sections of a few components (and ``general``)
+of the finished configuration of the previous run, but the file contains the
+whole configuration of the setup. ``compute._write_finalized_config`` therefore
+writes a sidecar index next to it, ``<expid>_finished_index.json``, with the
+byte range of every top-level section of the YAML file, and the size and
+modification time of the file the ranges belong to. The sidecar is renamed
+together with the YAML file when the configuration files of a run are moved to
+the experiment (``<expid>_finished_index.json_<DATE>`` next to
+``<expid>_finished_config.yaml_<DATE>``).
+
+``load_sections`` parses only the requested sections, with the C loader of
+libyaml if available. The parsed sections are kept, pickled, in memory and in
+the ``.finished_sections`` folder next to the YAML file, so that the prepare
+and tidy jobs of one chunk do not parse them again. Without a valid sidecar
+(i.e. for files written by older versions) the whole file is loaded as before.
+
+Once ``tidy.copy_all_results_to_exp`` moved the finished config of a run into
+the config folder of the experiment (as ``<expid>_finished_config.yaml_<run
+datestamp>``), an entry for it, with the end date of the run and its
+components, is appended to ``<experiment_config_dir>/finished_configs.idx``.
+The index is only ever appended to. ``PrevRunInfo.find_config`` looks up the
+config files of a date through it (see ``find_finished_configs``) instead of
+listing the config folder, as long as the folder did not change after the index
+was last written: config files copied or restored into the folder by hand are
+not in the index, and are found by listing the folder instead.
+"""
+import bisect
+import hashlib
+import json
+import os
+import pickle
+
+import yaml
+
+# Loader used for the finished config files
+Loader = getattr(yaml, "CFullLoader", yaml.FullLoader)
+
+# Number of parsed sections kept on disk, per config folder
+SECTION_CACHE_ENTRIES = 64
+
+# Pickled sections already parsed by this process, by cache key
+_section_cache = {}
+
+# Name of the index of the finished configs of an experiment
+CONFIGS_INDEX_NAME = "finished_configs.idx"
+
+# Loaded indices of finished configs, by path
+_configs_indices = {}
+
+
+def index_path(config_path):
+    """
+    Returns the path of the sidecar index of the finished config file
+    ``config_path``. The name of the sidecar must not contain
+    ``_finished_config.yaml``, as ``PrevRunInfo.find_config`` looks for the
+    config files by that name.
+    """
+    config_dir, config_name = os.path.split(config_path)
+    return os.path.join(
+        config_dir,
+        config_name.replace("_finished_config.yaml", "_finished_index.json", 1),
+    )
+
+
+def write_index(config_path, sections):
+    """
+    Writes the sidecar index of ``config_path``, just written by ``yaml.dump``
+    with the top-level keys ``sections``.
+
+    Top-level keys are the only lines of the file starting in the first column
+    with ``<key>:`` (``<key>`` may contain colons itself), in the (sorted) order
+    of ``yaml.dump``. A key that cannot be
+    found that way (e.g. because it needed quotes) is simply not in the index,
+    and is part of the range of the key before it.
+    """
+    try:
+        expected = sorted(sections)
+    except TypeError:
+        return
+    expected = [section for section in expected if isinstance(section, str)]
+
+    starts = []
+    position = 0
+    next_section = 0
+    with open(config_path, "rb") as config_file:
+        for line in config_file:
+            if next_section < len(expected) and line[:1] not in (
+                b" ", b"\t", b"#", b"-", b"\n", b"\r"
+            ):
+                # A top-level key written differently (i.e. quoted) is not
+                # found, skip the expected ones that come before it
+                key = line.split(b":", 1)[0].decode(errors="replace")
+                while (
+                    next_section < len(expected)
+                    and expected[next_section] < key
+                    and not line.startswith(f"{expected[next_section]}:".encode())
+                ):
+                    next_section += 1
+                if next_section < len(expected) and line.startswith(
+                    f"{expected[next_section]}:".encode()
+                ):
+                    starts.append((expected[next_section], position))
+                    next_section += 1
+            position += len(line)
+    stat = os.stat(config_path)
+    ranges = {}
+    for number, (section, start) in enumerate(starts):
+        end = starts[number + 1][1] if number + 1 < len(starts) else position
+        ranges[section] = [start, end]
+
+    index = {
+        "config_file": os.path.basename(config_path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sections": ranges,
+    }
+    with open(index_path(config_path) + ".tmp", "w") as index_file:
+        json.dump(index, index_file)
+    os.replace(index_path(config_path) + ".tmp", index_path(config_path))
+
+
+def read_index(config_path):
+    """
+    Returns the section ranges of the sidecar index of ``config_path``, or
+    ``None`` if there is no index or it does not belong to the current content
+    of ``config_path``.
+    """
+    try:
+        with open(index_path(config_path), "r") as index_file:
+            index = json.load(index_file)
+        stat = os.stat(config_path)
+    except (OSError, ValueError):
+        return None
+    if index.get("size") != stat.st_size or index.get("mtime_ns") != stat.st_mtime_ns:
+        return None
+    return index.get("sections")
+
+
+def _cache_key(config_path, section):
+    stat = os.stat(config_path)
+    description = (
+        f"{os.path.realpath(config_path)}\0{stat.st_size}\0{stat.st_mtime_ns}"
+        f"\0{section}"
+    )
+    return hashlib.blake2b(description.encode(), digest_size=16).hexdigest()
+
+
+def _cache_dir(config_path):
+    return os.path.join(os.path.dirname(config_path), ".finished_sections")
+
+
+def _cached_section(config_path, key):
+    if key not in _section_cache:
+        try:
+            with open(os.path.join(_cache_dir(config_path), key + ".pkl"), "rb") as cached:
+                _section_cache[key] = cached.read()
+        except OSError:
+            return None
+    try:
+        return pickle.loads(_section_cache[key])
+    except Exception:
+        del _section_cache[key]
+        return None
+
+
+def _cache_section(config_path, key, value):
+    try:
+        _section_cache[key] = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return
+    cache_dir = _cache_dir(config_path)
+    cache_path = os.path.join(cache_dir, key + ".pkl")
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(f"{cache_path}.{os.getpid()}.tmp", "wb") as cached:
+            cached.write(_section_cache[key])
+        os.replace(f"{cache_path}.{os.getpid()}.tmp", cache_path)
+        entries = sorted(
+            (os.path.join(cache_dir, name) for name in os.listdir(cache_dir)),
+            key=os.path.getmtime,
+        )
+        for old_entry in entries[:-SECTION_CACHE_ENTRIES]:
+            os.remove(old_entry)
+    except OSError:
+        # The cache is only an optimization (and the folder may belong to
+        # another user, i.e. for branched off experiments)
+        pass
+
+
+def _load_range(config_path, section, start, end):
+    with open(config_path, "rb") as config_file:
+        config_file.seek(start)
+        text = config_file.read(end - start)
+    try:
+        loaded = yaml.load(text, Loader=Loader)
+    except yaml.YAMLError:
+        # i.e. an alias to an anchor of another section
+        return None
+    if not isinstance(loaded, dict) or section not in loaded:
+        return None
+    return loaded[section]
+
+
+def load_sections(config_path, sections):
+    """
+    Loads the top-level ``sections`` of the finished config file
+    ``config_path``.
+
+    Parameters
+    ----------
+    config_path : str
+        Path of a ``<expid>_finished_config.yaml`` file
+    sections : list
+        Names of the top-level sections to load
+
+    Returns
+    -------
+    config : dict
+        The requested sections that exist in the file. If any of them cannot be
+        loaded on its own, the whole file, as ``yaml.load`` returns it.
+    """
+    config = {}
+    missing = []
+    for section in sections:
+        key = _cache_key(config_path, section)
+        value = _cached_section(config_path, key)
+        if value is None:
+            missing.append((section, key))
+        else:
+            config[section] = value
+    if not missing:
+        return config
+
+    ranges = read_index(config_path) or {}
+    for section, key in missing:
+        if section not in ranges:
+            break
+        value = _load_range(config_path, section, *ranges[section])
+        if value is None:
+            break
+        config[section] = value
+        _cache_section(config_path, key, value)
+    else:
+        return config
+
+    # No index, or a section that cannot be loaded on its own
+    with open(config_path, "r") as config_file:
+        full_config = yaml.load(config_file, Loader=Loader)
+    if isinstance(full_config, dict) and "dictitems" not in full_config:
+        for section, key in missing:
+            if section in full_config:
+                _cache_section(config_path, key, full_config[section])
+    return full_config
+
+
+def _end_datestamp(run_datestamp):
+    # ``<start>-<end>``, as ``prepare`` builds ``general.run_datestamp``
+    return run_datestamp.rsplit("-", 1)[-1]
+
+
+def record_finished_config(config):
+    """
+    Appends the finished config of this run, once moved into the config folder
+    of the experiment, to the index of finished configs of the experiment. If
+    the index does not exist yet, it is first created from the finished configs
+    already in the config folder.
+    """
+    gconfig = config["general"]
+    config_dir = gconfig["experiment_config_dir"]
+    configs_index_path = os.path.join(config_dir, CONFIGS_INDEX_NAME)
+    entries = []
+    if not os.path.isfile(configs_index_path):
+        marker = "_finished_config.yaml_"
+        for name in sorted(os.listdir(config_dir)):
+            if marker in name:
+                run_datestamp = name.split(marker, 1)[1]
+                entries.append(
+                    {
+                        "file": name,
+                        "run_datestamp": run_datestamp,
+                        "end_datestamp": _end_datestamp(run_datestamp),
+                    }
+                )
+    run_datestamp = gconfig["run_datestamp"]
+    name = f"{gconfig['expid']}_finished_config.yaml_{run_datestamp}"
+    if os.path.isfile(os.path.join(config_dir, name)) and not any(
+        entry["file"] == name for entry in entries
+    ):
+        entries.append(
+            {
+                "file": name,
+                "run_datestamp": run_datestamp,
+                "end_datestamp": _end_datestamp(run_datestamp),
+                "end_date": str(gconfig["end_date"]),
+                "components": gconfig.get("valid_model_names", []),
+            }
+        )
+    if not entries:
+        return
+    with open(configs_index_path, "a") as configs_index:
+        configs_index.write("".join(json.dumps(entry) + "\n" for entry in entries))
+
+
+def _load_configs_index(configs_index_path):
+    """
+    Returns the entries of the index ``configs_index_path`` as a list of
+    ``(end_datestamp, file)`` tuples sorted by date, or ``None`` if there is
+    no index. Reloaded only if the index changed.
+    """
+    try:
+        stat = os.stat(configs_index_path)
+    except OSError:
+        return None
+    signature = (stat.st_size, stat.st_mtime_ns)
+    cached = _configs_indices.get(configs_index_path)
+    if cached and cached[0] == signature:
+        return cached[1]
+    entries = []
+    seen = set()
+    with open(configs_index_path, "r") as configs_index:
+        for line in configs_index:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # i.e. a line cut short by a crash
+                continue
+            if entry["file"] in seen:
+                continue
+            seen.add(entry["file"])
+            entries.append((entry["end_datestamp"], len(entries), entry["file"]))
+    entries.sort()
+    entries = [(end_datestamp, name) for end_datestamp, _, name in entries]
+    _configs_indices[configs_index_path] = (signature, entries)
+    return entries
+
+
+def find_finished_configs(config_dir, end_datestamp):
+    """
+    Returns the names of the finished configs in ``config_dir`` of the runs
+    that ended at ``end_datestamp``, or ``None`` if the index of finished
+    configs of ``config_dir`` cannot be trusted for them: if there is no index,
+    if files were added to or removed from ``config_dir`` after the index was
+    last written (i.e. a config copied or restored by hand), or if a file of
+    the index is missing. The config folder needs to be listed in that case.
+    """
+    configs_index_path = os.path.join(config_dir, CONFIGS_INDEX_NAME)
+    try:
+        index_mtime = os.stat(configs_index_path).st_mtime_ns
+        folder_mtime = os.stat(config_dir).st_mtime_ns
+    except OSError:
+        return None
+    if folder_mtime > index_mtime:
+        return None
+    entries = _load_configs_index(configs_index_path)
+    if entries is None:
+        return None
+    first = bisect.bisect_left(entries, (end_datestamp,))
+    names = []
+    for entry_datestamp, name in entries[first:]:
+        if entry_datestamp != end_datestamp:
+            break
+        if not os.path.isfile(os.path.join(config_dir, name)):
+            return None
+        names.append(name)
+    return names
@@ -1,4 +1,14 @@
+import atexit
+import concurrent.futures
+import copy
+import hashlib
+import importlib.util
+import json
+import pickle
+import resource
+import shutil
 import sys
+import time
 from datetime import datetime
 import os
 import tempfile
@@ -64,6 +74,156 @@ def vprint(message, config):
         print(message)
 
 
+def map_concurrently(function, arguments, workers=1, pool="thread"):
+    """
+    Calls ``function`` once for every tuple of positional arguments in
+    ``arguments`` and returns the results in the same order. With ``workers``
+    larger than 1 the calls are distributed over a pool of threads or
+    processes, otherwise they are run one after the other.
+
+    Parameters
+    ----------
+    function : callable
+        Function to be called. For ``pool="process"`` it needs to be picklable,
+        i.e. defined at the top level of a module.
+    arguments : iterable
+        Iterable of tuples, each containing the positional arguments of one call.
+    workers : int
+        Maximum number of concurrent calls.
+    pool : str
+        Either ``"thread"`` or ``"process"``.
+
+    Returns
+    -------
+    results : list
+        The return values of ``function``, ordered as ``arguments``.
+    """
+    arguments = list(arguments)
+    if not workers or workers <= 1 or len(arguments) <= 1:
+        return [function(*args) for args in arguments]
+
+    if pool == "process":
+        executor_class = concurrent.futures.ProcessPoolExecutor
+    else:
+        executor_class = concurrent.futures.ThreadPoolExecutor
+    with executor_class(max_workers=min(workers, len(arguments))) as executor:
+        return list(executor.map(function, *zip(*arguments)))
+
+
+# Resolved recipes and plugin tables of this process, see ``read_recipe_and_plugins``
+_recipe_cache = {}
+
+
+def recipe_cache_dir():
+    return os.path.join(os.path.expanduser("~"), ".esm_tools", "recipe_cache")
+
+
+def read_recipe_and_plugins(recipe, plugins_bare, job_type, recipe_steps=None, use_disk=True):
+    """
+    Returns the recipe of ``job_type`` and the plugins it needs, as built by
+    ``esm_plugin_manager.read_recipe`` and
+    ``esm_plugin_manager.read_plugin_information``. Both are cached in this
+    process and on disk (in ``~/.esm_tools/recipe_cache``), for the
+    modification time and size of the ``recipe`` and ``plugins_bare`` files,
+    so that the YAML files are only parsed again when they change.
+
+    Parameters
+    ----------
+    recipe : str
+        Path of ``esm_runscripts.yaml``
+    plugins_bare : str
+        Path of ``esm_plugins.yaml``
+    job_type : str
+        Job type the recipe is resolved for
+    recipe_steps : list, optional
+        Steps defined by the user, replacing those of the recipe
+    use_disk : bool
+        Read and write the disk cache too
+
+    Returns
+    -------
+    framework_recipe : dict
+    framework_plugins : dict
+    """
+    file_signatures = []
+    for path in [recipe, plugins_bare]:
+        try:
+            stat = os.stat(path)
+            file_signatures.append([path, stat.st_size, stat.st_mtime_ns])
+        except OSError:
+            file_signatures.append([path, None, None])
+    key_description = json.dumps(
+        [
+            file_signatures,
+            job_type,
+            recipe_steps,
+            sys.prefix,
+            getattr(esm_plugin_manager, "__version__", None),
+        ],
+        sort_keys=True,
+        default=str,
+    )
+    key = hashlib.blake2b(key_description.encode(), digest_size=16).hexdigest()
+
+    if key not in _recipe_cache and use_disk:
+        try:
+            with open(os.path.join(recipe_cache_dir(), key + ".pkl"), "rb") as cached:
+                _recipe_cache[key] = pickle.load(cached)
+        except Exception:
+            pass
+
+    if key not in _recipe_cache:
+        framework_recipe = esm_plugin_manager.read_recipe(
+            recipe, {"job_type": job_type}, True
+        )
+        if recipe_steps:
+            framework_recipe["recipe"] = recipe_steps
+        framework_plugins = esm_plugin_manager.read_plugin_information(
+            plugins_bare, framework_recipe, True
+        )
+        _recipe_cache[key] = (framework_recipe, framework_plugins)
+        if use_disk:
+            cache_path = os.path.join(recipe_cache_dir(), key + ".pkl")
+            try:
+                os.makedirs(recipe_cache_dir(), exist_ok=True)
+                with open(f"{cache_path}.{os.getpid()}.tmp", "wb") as cached:
+                    pickle.dump(_recipe_cache[key], cached)
+                os.replace(f"{cache_path}.{os.getpid()}.tmp", cache_path)
+            except Exception:
+                # The cache is only an optimization, never fail because of it
+                pass
+
+    return copy.deepcopy(_recipe_cache[key])
+
+
+def check_plugins_lazily(framework_plugins):
+    """
+    Checks that the modules of the plugins can be found, without importing
+    them: ``esm_plugin_manager.work_through_recipe`` imports each module right
+    before its step runs. Only ``core`` plugins are checked this way, the
+    others (which may need to be installed first) are checked by
+    ``esm_plugin_manager.check_plugin_availability``.
+    """
+    unchecked = {}
+    for workitem, plugin in framework_plugins.items():
+        module = plugin.get("module") if isinstance(plugin, dict) else None
+        if not module or plugin.get("type") != "core":
+            unchecked[workitem] = plugin
+            continue
+        try:
+            found = importlib.util.find_spec(module) is not None
+        except (ImportError, ValueError):
+            found = False
+        if not found:
+            esm_parser.user_error(
+                "Missing plugin",
+                f"The module ``{module}`` of the recipe step ``{workitem}`` "
+                "cannot be found.",
+            )
+    if unchecked:
+        esm_plugin_manager.check_plugin_availability(unchecked)
+
+
 def evaluate(config, job_type, recipe_name):
 
     # Check for a user defined compute recipe in the setup section of the
@@ -83,32 +243,186 @@ def evaluate(config, job_type, recipe_name):
 
     FUNCTION_PATH = esm_rcfile.EsmToolsDir("FUNCTION_PATH")
     recipe = FUNCTION_PATH + "esm_software/esm_runscripts/esm_runscripts.yaml"
-    need_to_parse_recipe = True
     plugins_bare = FUNCTION_PATH + "/esm_software/esm_runscripts/esm_plugins.yaml"
-    need_to_parse_plugins = True
 
-    framework_recipe = esm_plugin_manager.read_recipe(
-        recipe, {"job_type": job_type}, need_to_parse_recipe
-    )
-    if recipe_steps:
-        framework_recipe["recipe"] = recipe_steps
-    framework_plugins = esm_plugin_manager.read_plugin_information(
-        plugins_bare, framework_recipe, need_to_parse_plugins
+    framework_recipe, framework_plugins = read_recipe_and_plugins(
+        recipe,
+        plugins_bare,
+        job_type,
+        recipe_steps,
+        use_disk=config["general"].get("recipe_cache", True),
     )
-    esm_plugin_manager.check_plugin_availability(framework_plugins)
+    check_plugins_lazily(framework_plugins)
 
-    config = esm_plugin_manager.work_through_recipe(
-        framework_recipe, framework_plugins, config
-    )
+    if config["general"].get("profile", False):
+        config = profile_recipe(framework_recipe, framework_plugins, config, job_type)
+    else:
+        config = esm_plugin_manager.work_through_recipe(
+            framework_recipe, framework_plugins, config
+        )
     return config
 
 
+#########################################################################################
+#                                   profiling                                           #
+#########################################################################################
+# Measurements of the recipe steps run in this process, in order
+_step_profiles = []
+# ``cProfile.Profile`` objects of the steps that were not written to disk yet
+_pending_cprofiles = []
+# Steps running ``cProfile``, only one profiler can be active at a time
+_active_cprofiles = []
+
+
+def _peak_rss_mib():
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ``ru_maxrss`` is in kilobytes on Linux, but in bytes on macOS
+    if sys.platform == "darwin":
+        return peak_rss / 1024 ** 2
+    return peak_rss / 1024
+
+
+def _cpu_seconds():
+    times = os.times()
+    return times.user + times.system, times.children_user + times.children_system
+
+
+def profile_recipe(framework_recipe, framework_plugins, config, job_type):
+    """
+    Works through the recipe one step at a time, measuring the wall time, the
+    CPU time (of this process and of the subprocesses the step waited for) and
+    the peak resident memory of every step. With
+    ``general.profile_cprofile: True`` each step is also run under
+    ``cProfile``. The results are written by ``write_profile`` and printed by
+    ``end_it_all``.
+    """
+    use_cprofile = config["general"].get("profile_cprofile", False)
+    if use_cprofile:
+        import cProfile
+
+    for index, step in enumerate(framework_recipe["recipe"]):
+        step_recipe = dict(framework_recipe, recipe=[step])
+        rss_before = _peak_rss_mib()
+        cpu_before, children_cpu_before = _cpu_seconds()
+        # Steps of recipes evaluated by a step of another recipe (e.g. the
+        # prepare recipe of the resubmission in tidy) are part of the
+        # ``cProfile`` results of that step
+        profiler = None
+        if use_cprofile and not _active_cprofiles:
+            profiler = cProfile.Profile()
+            _active_cprofiles.append(profiler)
+        start = time.perf_counter()
+        try:
+            if profiler:
+                profiler.enable()
+            config = esm_plugin_manager.work_through_recipe(
+                step_recipe, framework_plugins, config
+            )
+        finally:
+            # Also record the step if it ends the process (``end_it_all``)
+            if profiler:
+                profiler.disable()
+                _active_cprofiles.remove(profiler)
+            wall_time = time.perf_counter() - start
+            cpu_after, children_cpu_after = _cpu_seconds()
+            peak_rss = _peak_rss_mib()
+            _step_profiles.append(
+                {
+                    "recipe": job_type,
+                    "step": step,
+                    "wall_time": wall_time,
+                    "cpu_time": cpu_after - cpu_before,
+                    "children_cpu_time": children_cpu_after - children_cpu_before,
+                    "peak_rss_mib": peak_rss,
+                    "peak_rss_growth_mib": peak_rss - rss_before,
+                }
+            )
+            if profiler:
+                _pending_cprofiles.append((f"{job_type}_{index:02d}_{step}", profiler))
+    write_profile(config)
+    return config
+
+
+def profile_dir(config):
+    """
+    Returns the folder the profiling results are written to, the log folder of
+    the run if it exists already, otherwise the log folder of the experiment,
+    or ``None`` if neither exists yet.
+    """
+    for key in ["thisrun_log_dir", "experiment_log_dir"]:
+        log_dir = config["general"].get(key)
+        if log_dir and os.path.isdir(log_dir):
+            return log_dir
+    return None
+
+
+def write_profile(config):
+    """
+    Writes the measurements of all the recipe steps run so far in this process
+    to ``<log_dir>/<expid>_<jobtype>_profile_<run_datestamp>.json``, and the
+    ``cProfile`` results of the steps not written yet to
+    ``<log_dir>/<expid>_<recipe>_<step number>_<step>_<run_datestamp>.prof``.
+    Nothing is written while no log folder exists, the results are kept for
+    the next call.
+    """
+    gconfig = config["general"]
+    log_dir = profile_dir(config)
+    if not _step_profiles or not log_dir:
+        return
+    expid = gconfig.get("expid", "")
+    run_datestamp = gconfig.get("run_datestamp", "")
+    profile_path = os.path.join(
+        log_dir, f"{expid}_{gconfig.get('jobtype', '')}_profile_{run_datestamp}.json"
+    )
+    try:
+        with open(profile_path, "w") as profile_file:
+            json.dump(_step_profiles, profile_file, indent=1)
+        while _pending_cprofiles:
+            name, profiler = _pending_cprofiles[0]
+            profiler.dump_stats(
+                os.path.join(log_dir, f"{expid}_{name}_{run_datestamp}.prof")
+            )
+            del _pending_cprofiles[0]
+    except OSError as error:
+        # Profiling must never break the run
+        print(f"Could not write the profile to {log_dir}: {error}", flush=True)
+
+
+def profile_table():
+    """
+    Returns the lines of a table of the measurements of all the recipe steps
+    run so far in this process.
+    """
+    lines = [
+        f"{'recipe':<12} {'step':<40} {'wall (s)':>10} {'cpu (s)':>10} "
+        f"{'child cpu (s)':>14} {'peak rss (MiB)':>15}"
+    ]
+    total_wall = sum(entry["wall_time"] for entry in _step_profiles)
+    for entry in _step_profiles:
+        lines.append(
+            f"{entry['recipe']:<12} {entry['step']:<40} {entry['wall_time']:>10.3f} "
+            f"{entry['cpu_time']:>10.3f} {entry['children_cpu_time']:>14.3f} "
+            f"{entry['peak_rss_mib']:>15.1f}"
+        )
+    slowest = sorted(_step_profiles, key=lambda entry: entry["wall_time"])[-5:]
+    lines.append(f"{'total':<53} {total_wall:>10.3f}")
+    lines.append(
+        "slowest steps: "
+        + ", ".join(
+            f"{entry['step']} ({entry['wall_time']:.3f} s)"
+            for entry in reversed(slowest)
+        )
+    )
+    return lines
+
+
 #########################################################################################
 #                                   general stuff                                       #
 #########################################################################################
 def end_it_all(config):
-    if config["general"]["profile"]:
-        for line in timing_info:
+    if config["general"]["profile"] and _step_profiles:
+        write_profile(config)
+        for line in profile_table():
             print(line)
     if config["general"]["verbose"]:
         print("Exiting entire Python process!")
@@ -177,19 +491,25 @@ class SmartSink():
     '''
     A class for smart sinks that allow for logging (using ``logger`` from loguru), even
     if the file path of the log file is not yet defined. The actual sink is not the
-    instanced object itself, but the method ``sink`` of the instance. The log record is
-    saved in ``self.log_record`` and the log file is written using the path specified
-    in ``self.path``. If the path is not specified, the log is stored only in the
-    ``self.log_record``. When the path is finally specified, ``self.log_record`` is
-    dumped into the log file and from that moment, any time ``logger`` logs something it
-    will also be written into the file. To specify the path the method ``def_path``
-    needs to be used.
+    instanced object itself, but the method ``sink`` of the instance. While the path is
+    not specified, the log is kept in ``self.log_record``, and once it holds more than
+    ``max_buffer_size`` bytes, moved to a temporary file, so that long sessions do not
+    keep their whole log in memory. When the path is finally specified with
+    ``def_path``, the log kept so far is dumped into the log file and from that
+    moment, any time ``logger`` logs something it is written into the file, through
+    a single line-buffered file handle, so that no message is lost if the job is
+    killed. The file is synced to disk when the process exits.
     '''
 
-    def __init__(self):
+    def __init__(self, max_buffer_size=4 * 1024 * 1024):
         # Initialise instance variables
         self.log_record = []
         self.path = None
+        self.max_buffer_size = max_buffer_size
+        self._buffer_size = 0
+        self._spill_file = None
+        self._log_file = None
+        self._close_at_exit = False
 
     def sink(self, message):
         '''
@@ -203,9 +523,25 @@ class SmartSink():
         message : str
             String containing the logging message.
         '''
+        # Only the text is kept, not loguru's record attached to the message
+        message = str(message)
         if self.path:
             self.write_log(message, "a")
+            return
         self.log_record.append(message)
+        self._buffer_size += len(message)
+        if self._buffer_size > self.max_buffer_size:
+            self._spill()
+
+    def _spill(self):
+        '''
+        Moves ``self.log_record`` into the temporary file.
+        '''
+        if not self._spill_file:
+            self._spill_file = tempfile.TemporaryFile(mode="w+")
+        self._spill_file.write("".join(self.log_record))
+        self.log_record = []
+        self._buffer_size = 0
 
     def write_log(self, message, wmode):
         '''
@@ -217,23 +553,62 @@ class SmartSink():
             String containing the logging message or list containing more than one
             logging message, to be written in the file.
         wmode : str
-            Writing mode to choose among ``"w"`` or ``"a"``.
+            Writing mode to choose among ``"w"`` or ``"a"``. With ``"w"`` the file
+            is opened again and truncated.
         '''
         if isinstance(message, str):
             message = [message]
-        with open(self.path, wmode) as log:
-            for line in message:
-                log.write(line)
+        if wmode == "w" or not self._log_file:
+            self.close()
+            # Line buffered, every message is handed to the OS right away
+            self._log_file = open(self.path, wmode, buffering=1)
+            if not self._close_at_exit:
+                atexit.register(self.close)
+                self._close_at_exit = True
+        self._log_file.write("".join(message))
 
     def def_path(self, path):
         '''
-        Method to define the path of the file. Once the path is defined, the log record
-        is written into the file.
+        Method to define the path of the file. Once the path is defined, the log
+        kept so far is written into the file. If a path was already defined, the
+        content of the previous file is copied into the new one.
 
         Parameters
         ----------
         path : str
             Path of the logging file.
         '''
+        previous_path = self.path
+        self.close()
         self.path = path
-        self.write_log(self.log_record, "w")
+        if previous_path and os.path.realpath(previous_path) == os.path.realpath(path):
+            self.write_log([], "a")
+        else:
+            self.write_log([], "w")
+            if previous_path and os.path.isfile(previous_path):
+                with open(previous_path, "r") as previous_log:
+                    shutil.copyfileobj(previous_log, self._log_file)
+        if self._spill_file:
+            self._spill_file.seek(0)
+            shutil.copyfileobj(self._spill_file, self._log_file)
+            self._spill_file.close()
+            self._spill_file = None
+        self.write_log(self.log_record, "a")
+        self.log_record = []
+        self._buffer_size = 0
+        self._log_file.flush()
+
+    def close(self):
+        '''
+        Flushes the log file and syncs it to disk, and closes it. Called when the
+        process exits, later messages open the file again.
+        '''
+        if not self._log_file:
+            return
+        try:
+            self._log_file.flush()
+            os.fsync(self._log_file.fileno())
+        except (OSError, ValueError):
+            pass
+        self._log_file.close()
+        self._log_file = None
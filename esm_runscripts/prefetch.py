@@ -0,0 +1,289 @@
+"""
+Look-ahead staging of the ``forcing`` and ``input`` files of the next run.
+
+With ``general.prefetch_next_run: True``, ``filelists.assemble`` remembers the
+``forcing`` and ``input`` file lists as they are right before
+``replace_year_placeholder`` resolves ``@YEAR@`` and the ``need_year_after``,
+``need_timestep_after``, etc. information. ``tidy.wait_and_observe`` runs in
+another process, before the file lists of the run are assembled there, so
+``start_prefetch`` rebuilds the templates itself if this process has none (see
+``build_templates``). While the model is running, ``tidy.wait_and_observe``
+resolves these templates again for the dates of the next run and copies the files into the folders of that run
+(``<experiment_dir>/run_<next_run_datestamp>``) in a background thread. The
+next compute job then finds its files in place and recognises them through the
+file signatures record (see ``file_signatures.py``), so that ``copy_files``
+does not copy them again.
+
+Only files moved with ``copy``, ``reflink`` or ``copy_file_range`` from the
+init to the experiment tree are prefetched: links are cheap anyway, and moving
+a file ahead of time would take it away from the current run. File lists that
+depend on anything else than the date of the run (i.e. ``choose_`` blocks on
+the run number) are not re-evaluated; files that the next run ends up not
+needing are simply left unused in its run folder.
+"""
+import copy
+import os
+import threading
+
+from . import file_signatures, filelists, helpers
+from .file_manifest import FileManifest
+
+PREFETCH_FILETYPES = ["forcing", "input"]
+PREFETCH_MOVEMENTS = ["copy", "reflink", "copy_file_range"]
+
+# Keys of the component sections changed by the steps of ``filelists.assemble``
+# that come before ``replace_year_placeholder``
+FILE_LIST_SUFFIXES = (
+    "_sources",
+    "_targets",
+    "_in_work",
+    "_files",
+    "_additional_information",
+)
+
+# File lists of the current run before the year placeholders were replaced, by
+# ``(model, filetype)``
+_templates = {}
+
+
+def remember_templates(config):
+    """
+    Keeps a copy of the ``forcing`` and ``input`` sources, targets and
+    additional information of every model, if ``general.prefetch_next_run``
+    is set. Called by ``filelists.assemble`` before
+    ``replace_year_placeholder``.
+    """
+    if not config["general"].get("prefetch_next_run", False):
+        return config
+    _templates.clear()
+    for filetype in PREFETCH_FILETYPES:
+        for model in config["general"]["valid_model_names"] + ["general"]:
+            model_config = config.get(model, {})
+            if not (
+                filetype + "_sources" in model_config
+                and filetype + "_targets" in model_config
+            ):
+                continue
+            _templates[(model, filetype)] = {
+                key: copy.deepcopy(model_config[key])
+                for key in [
+                    filetype + "_sources",
+                    filetype + "_targets",
+                    filetype + "_additional_information",
+                ]
+                if key in model_config
+            }
+    return config
+
+
+def _file_list_config(config):
+    """
+    Returns a copy of ``config`` in which the file lists, the file movements and
+    the defaults of the components can be changed without changing ``config``.
+    Everything else is shared with ``config``, as it may not be copyable (i.e.
+    the monitor file).
+    """
+    file_list_config = dict(config)
+    for model in config["general"]["valid_model_names"] + ["general"]:
+        model_config = dict(config[model])
+        for key, value in model_config.items():
+            if key in ["file_movements", "defaults.yaml"] or (
+                isinstance(key, str) and key.endswith(FILE_LIST_SUFFIXES)
+            ):
+                model_config[key] = copy.deepcopy(value)
+        file_list_config[model] = model_config
+    return file_list_config
+
+
+def build_templates(config):
+    """
+    Runs the steps of ``filelists.assemble`` that come before
+    ``replace_year_placeholder`` on a copy of ``config``, and remembers the
+    templates of the result. For jobs that did not assemble the file lists of
+    the run (yet), i.e. ``tidy``.
+
+    Returns
+    -------
+    file_list_config : dict
+        The copy of ``config``, with the file movements completed
+    """
+    file_list_config = _file_list_config(config)
+    file_list_config = filelists.complete_all_file_movements(file_list_config)
+    file_list_config = filelists.rename_sources_to_targets(file_list_config)
+    file_list_config = filelists.choose_needed_files(file_list_config)
+    file_list_config = filelists.complete_targets(file_list_config)
+    file_list_config = filelists.complete_sources(file_list_config)
+    file_list_config = filelists.reuse_sources(file_list_config)
+    remember_templates(file_list_config)
+    return file_list_config
+
+
+def next_run_config(config):
+    """
+    Builds a reduced config for the run following the current one, containing
+    only what is needed to assemble the ``forcing`` and ``input`` file lists
+    from the remembered templates.
+
+    Returns
+    -------
+    next_config : dict or None
+        ``None`` if there is no next run, or nothing to prefetch.
+    """
+    gconfig = config["general"]
+    if not _templates or gconfig["next_date"] >= gconfig["final_date"]:
+        return None
+
+    current_date = gconfig["next_date"]
+    next_date = current_date.add(gconfig["delta_date"])
+    end_date = next_date - (0, 0, 1, 0, 0, 0)
+    run_datestamp = (
+        current_date.format(form=9, givenph=False, givenpm=False, givenps=False)
+        + "-"
+        + end_date.format(form=9, givenph=False, givenpm=False, givenps=False)
+    )
+    thisrun_dir = gconfig["experiment_dir"] + "/run_" + run_datestamp
+
+    models = gconfig["valid_model_names"] + ["general"]
+    next_config = {
+        "general": {
+            "verbose": False,
+            "valid_model_names": gconfig["valid_model_names"],
+            "all_model_filetypes": PREFETCH_FILETYPES,
+            "out_filetypes": gconfig["out_filetypes"],
+            "current_date": current_date,
+            "prev_date": current_date - (0, 0, 1, 0, 0, 0),
+            "next_date": next_date,
+            "run_datestamp": run_datestamp,
+            "thisrun_dir": thisrun_dir,
+            "thisrun_work_dir": thisrun_dir + "/work/",
+        }
+    }
+    for model in models:
+        if model != "general":
+            next_config[model] = {}
+        for filetype in PREFETCH_FILETYPES:
+            thisrun_filetype_dir = config[model].get(f"thisrun_{filetype}_dir")
+            if thisrun_filetype_dir:
+                next_config[model][f"thisrun_{filetype}_dir"] = (
+                    thisrun_filetype_dir.replace(gconfig["thisrun_dir"], thisrun_dir, 1)
+                )
+            next_config[model].update(copy.deepcopy(_templates.get((model, filetype), {})))
+
+    next_config = filelists.replace_year_placeholder(next_config)
+    next_config = filelists.globbing(next_config)
+    next_config = filelists.target_subfolders(next_config)
+    next_config = filelists.assemble_intermediate_files_and_finalize_targets(
+        next_config
+    )
+    return next_config
+
+
+class Prefetch(threading.Thread):
+    """
+    Background thread copying the files of the next run. The results of
+    ``filelists.move_one_file`` are kept in ``self.results`` and only applied
+    to the file signatures record by ``finish_prefetch``, in the main thread.
+    """
+
+    def __init__(self, config, movements):
+        super().__init__(name="esm_runscripts_prefetch", daemon=True)
+        self.config = config
+        self.movements = movements
+        self.results = []
+        self.error = None
+
+    def run(self):
+        workers, pool = filelists.file_movement_workers(self.config)
+        try:
+            self.results = helpers.map_concurrently(
+                filelists.move_one_file, self.movements, workers, pool
+            )
+        except Exception as error:
+            self.error = error
+
+
+def start_prefetch(config):
+    """
+    Starts copying the ``forcing`` and ``input`` files of the next run into its
+    run folder, if ``general.prefetch_next_run`` is set.
+
+    Returns
+    -------
+    prefetch : Prefetch or None
+        The running thread, to be passed to ``finish_prefetch``
+    """
+    if not config["general"].get("prefetch_next_run", False):
+        return None
+    movement_config = config
+    if not _templates:
+        movement_config = build_templates(config)
+    next_config = next_run_config(config)
+    if not next_config:
+        return None
+
+    verbose = config["general"]["verbose"]
+    signatures = file_signatures.get_file_signatures(config)
+    movements = []
+    for entry in FileManifest.from_config(next_config, PREFETCH_FILETYPES):
+        if not entry.source or not entry.intermediate:
+            continue
+        try:
+            movement = filelists.get_movement(
+                movement_config, entry.model, entry.category, entry.filetype, "init", "thisrun"
+            )
+        except KeyError:
+            continue
+        if movement not in PREFETCH_MOVEMENTS:
+            continue
+        file_source = filelists.resolve_symlinks(os.path.normpath(entry.source), False)
+        file_target = os.path.normpath(entry.intermediate)
+        if os.path.isdir(file_source):
+            continue
+        movements.append(
+            (
+                file_source,
+                file_target,
+                filelists.get_method(movement),
+                verbose,
+                signatures.get(file_target) if signatures else None,
+                signatures is not None,
+            )
+        )
+    if not movements:
+        return None
+
+    config["general"]["monitor_file"].write(
+        f"prefetching {len(movements)} files into "
+        f"{next_config['general']['thisrun_dir']} \n"
+    )
+    prefetch = Prefetch(config, movements)
+    prefetch.start()
+    return prefetch
+
+
+def finish_prefetch(config, prefetch):
+    """
+    Waits for ``prefetch`` to finish and records the prefetched files in the
+    file signatures record.
+    """
+    if not prefetch:
+        return config
+    prefetch.join()
+    monitor_file = config["general"]["monitor_file"]
+    if prefetch.error:
+        monitor_file.write(f"prefetching failed: {prefetch.error} \n")
+        return config
+
+    signatures = file_signatures.get_file_signatures(config)
+    counts = {"success": 0, "skipped": 0, "missing": 0}
+    for status, _, _, entry, _, _ in prefetch.results:
+        counts[status] += 1
+        if signatures:
+            signatures.update(entry)
+    if signatures:
+        signatures.save()
+    monitor_file.write(
+        f"prefetched {counts['success']} files, {counts['skipped']} already in "
+        f"place, {counts['missing']} missing \n"
+    )
+    return config
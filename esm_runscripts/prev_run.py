@@ -1,12 +1,67 @@
 import os
+import re
 import sys
-import yaml
-
-import questionary
 
 import esm_parser
 from esm_calendar import Date, Calendar
 
+from . import finished_config
+
+# Variables of the previous run, i.e. ``fesom.time_step`` in
+# ``${prev_run.fesom.time_step}``
+_prev_run_variable = re.compile(r"prev_run\.([^}\s]+)")
+
+
+def _find_prev_run_values(nested_dict, path, found):
+    # Same search as ``PrevRunInfo.str_value_in_nested_dictionary``: through
+    # dictionaries, but not lists
+    for key, value in nested_dict.items():
+        if isinstance(value, dict):
+            _find_prev_run_values(value, path + [str(key)], found)
+        elif isinstance(value, str) and "prev_run." in value:
+            found[".".join(path + [str(key)])] = _prev_run_variable.findall(value)
+
+
+def prev_run_references(config):
+    """
+    Finds the values of ``config`` that use the ``prev_run`` feature.
+    ``SimulationSetup`` stores the result in ``general.prev_run_references``
+    once the config is assembled, so that ``PrevRunInfo`` does not need to
+    search the whole config every time it is created.
+
+    Parameters
+    ----------
+    config : dict, esm_parser.ConfigSetup
+        Configuration of the current simulation, before the ``prev_run``
+        variables are resolved.
+
+    Returns
+    -------
+    references : dict
+        For each component containing ``prev_run`` values (``general`` being
+        the last one), the paths of these values inside of the component and
+        the variables of the previous run they use, i.e.
+        ``{"echam": {"prev_time_step": ["fesom.time_step"]}}``.
+    """
+    components = [
+        component for component in config
+        if component not in ["prev_run", "general"]
+    ] + ["general"]
+    references = {}
+    for component in components:
+        component_config = config.get(component)
+        if isinstance(component_config, dict):
+            found = {}
+            _find_prev_run_values(component_config, [], found)
+            if found:
+                references[component] = found
+        elif isinstance(component_config, str) and "prev_run." in component_config:
+            references[component] = {
+                "": _prev_run_variable.findall(component_config)
+            }
+    return references
+
+
 class PrevRunInfo(dict):
     """
     A dictionary subclass to access information from the previous run. The object is
@@ -68,28 +123,16 @@ class PrevRunInfo(dict):
         """
         Lists components containning variables using the ``prev_run`` feature. Reading
         of the previous config files will occur only for those components that use
-        ``prev_var``.
+        ``prev_var``. The components are taken from
+        ``general.prev_run_references`` if ``SimulationSetup`` already stored it
+        in the config, otherwise the config is searched.
         """
         # Search for components only if ``self._config`` is not empty
         if len(self._config) > 0:
-            components = self._config.keys()
-            # Make sure prev_run is not included and also that general is the last of
-            # the components
-            components = [
-                component for component in components
-                if component not in ["prev_run", "general"]
-            ]
-            components.append("general")
-            # Loop through the components, and find which ones contain at least one
-            # ``prev_run.`` value
-            c_with_prev_run = []
-            for component in components:
-                if self.str_value_in_nested_dictionary(
-                    "prev_run.", self._config[component]
-                ):
-                    c_with_prev_run.append(component)
-
-            self._components = c_with_prev_run
+            references = self._config.get("general", {}).get("prev_run_references")
+            if references is None:
+                references = prev_run_references(self._config)
+            self._components = list(references)
         else:
             self._components = []
 
@@ -223,9 +266,11 @@ class PrevRunInfo(dict):
                 self._prev_config_count += 1
                 #print(f"PREV CONFIG COUNT: {self._prev_config_count}")
 
-                # Open the file and load the previous run information
-                with open(prev_run_config_file, "r") as prev_file:
-                    prev_config = yaml.load(prev_file, Loader=yaml.FullLoader)
+                # Load the previous run information, only the sections needed if
+                # the file is indexed
+                prev_config = finished_config.load_sections(
+                    prev_run_config_file, [component, "general"]
+                )
                 # Back-compatibility with old config files
                 if "dictitems" in prev_config:
                     prev_config = prev_config["dictitems"]
@@ -305,6 +350,12 @@ class PrevRunInfo(dict):
            ``component`` as the path. If ``prev_run_config_file`` is not defined in the
            runscript, throw an error indicating how to proceed.
 
+        The config files of an end date are looked up in the index of finished
+        configs of the config folder (see ``finished_config.find_finished_configs``).
+        If the folder changed after the index was last written (i.e. a config file
+        was copied or restored into it by hand), or a file of the index is missing,
+        the folder is listed instead.
+
         Parameters
         ----------
         component : str
@@ -405,15 +456,22 @@ class PrevRunInfo(dict):
             form=9, givenph=False, givenpm=False, givenps=False
         )
 
-        # List all the config files in the config folder
-        config_files = [
-            cf for cf in os.listdir(config_dir) if "_finished_config.yaml" in cf
-        ]
-        # Select the ones ending with the correct timestamp
-        potential_prev_configs = []
-        for cf in config_files:
-            if cf.endswith(prev_datestamp):
-                potential_prev_configs.append(cf)
+        # Look the config files ending with the correct timestamp up in the index of
+        # finished configs. Without an index, if the config folder changed since the
+        # index was written (i.e. a config file copied in by hand), or nothing found
+        # in it, list all the config files in the config folder
+        potential_prev_configs = finished_config.find_finished_configs(
+            config_dir, prev_datestamp
+        )
+        if not potential_prev_configs:
+            config_files = [
+                cf for cf in os.listdir(config_dir) if "_finished_config.yaml" in cf
+            ]
+            # Select the ones ending with the correct timestamp
+            potential_prev_configs = []
+            for cf in config_files:
+                if cf.endswith(prev_datestamp):
+                    potential_prev_configs.append(cf)
 
         # CASES FOR FINDING THE CONFIG FILE
         # ---------------------------------
@@ -488,6 +546,9 @@ class PrevRunInfo(dict):
         text : str
             Text to be displayed in the questionary.
         """
+        # NOTE: imported here, only interactive runs need it
+        import questionary
+
         questionary.print(100*"=")
         questionary.print(text)
         questionary.print(100*"=")
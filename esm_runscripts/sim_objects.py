@@ -12,7 +12,7 @@ import esm_parser
 import esm_rcfile
 
 
-from . import batch_system, compute, helpers, prepare, tidy, prev_run
+from . import batch_system, compute, config_cache, helpers, prepare, tidy, prev_run
 
 
 class SimulationSetup(object):
@@ -24,11 +24,32 @@ class SimulationSetup(object):
         else:
             self.command_line_config = {}
 
+        cached_config = None
         if not user_config:
-            user_config = self.get_user_config_from_command_line(command_line_config)
-        if user_config["general"].get("debug_obj_init", False):
-            pdb.set_trace()
-        self.get_total_config_from_user_config(user_config)
+            cached_config = config_cache.get_warm_config(
+                self.command_line_config
+            ) or config_cache.load_cached_config(self.command_line_config)
+        if cached_config:
+            self.config = cached_config
+            if "prev_run_references" not in self.config["general"]:
+                self.find_prev_run_references()
+            if self.config["general"].get("debug_obj_init", False):
+                pdb.set_trace()
+        else:
+            from_command_line = not user_config
+            if not user_config:
+                user_config = self.get_user_config_from_command_line(command_line_config)
+            if user_config["general"].get("debug_obj_init", False):
+                pdb.set_trace()
+            self.get_total_config_from_user_config(user_config)
+            self.find_prev_run_references()
+            config_cache.store_warm_config(
+                self.config, self.command_line_config, user_config
+            )
+            if from_command_line:
+                config_cache.store_cached_config(
+                    self.config, self.command_line_config, user_config
+                )
 
         self.config["general"]["command_line_config"] = self.command_line_config
         if "verbose" not in self.config["general"]:
@@ -111,6 +132,26 @@ class SimulationSetup(object):
 
     ##########################    ASSEMBLE ALL THE INFORMATION  ##############################
 
+    def find_prev_run_references(self):
+        """
+        Records in ``general.prev_run_references`` which values of the config
+        use the ``prev_run`` feature, and which variables of the previous run
+        they need (see ``prev_run.prev_run_references``). Done once, when the
+        config is assembled, and kept in the cached configs, so that every
+        ``PrevRunInfo`` created for this config knows right away which
+        components need a previous config file.
+        """
+        references = prev_run.prev_run_references(self.config)
+        self.config["general"]["prev_run_references"] = references
+        if self.config["general"].get("verbose", False):
+            for component, values in references.items():
+                for path, variables in values.items():
+                    print(
+                        f"{component}.{path} uses the previous run: "
+                        + ", ".join(variables),
+                        flush=True,
+                    )
+
     def get_user_config_from_command_line(self, command_line_config):
         try:
             # use the full absolute path instead of CWD
@@ -0,0 +1,80 @@
+"""
+Import-time breakdown of the start of ``esm_runscripts``.
+
+With ``--startup-profile``, ``cli.main`` calls ``start`` right after parsing the
+command line and ``report`` once the ``SimulationSetup`` is built, i.e. right
+before the recipe of the job starts. Every ``import`` statement executed in
+between is timed. The report lists the time spent in the imports of each
+top-level package, without the time of the other packages they import in turn,
+so that the packages responsible for a slow start can be told apart.
+"""
+import builtins
+import time
+
+# Number of packages listed in the report
+REPORT_ENTRIES = 20
+
+_original_import = None
+_start_time = None
+# Import time by top-level package, without nested imports of other packages
+_self_times = {}
+# Cumulative time of the nested imports of the import being timed, one entry
+# per level of nesting
+_stack = []
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level:
+        # Relative imports belong to the package doing them
+        package = (globals or {}).get("__package__") or ""
+    else:
+        package = name
+    package = package.partition(".")[0]
+    _stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        duration = time.perf_counter() - start
+        nested = _stack.pop()
+        _self_times[package] = _self_times.get(package, 0.0) + duration - nested
+        if _stack:
+            _stack[-1] += duration
+
+
+def start():
+    """
+    Starts timing the imports.
+    """
+    global _original_import, _start_time
+    if _original_import is not None:
+        return
+    _original_import = builtins.__import__
+    _start_time = time.perf_counter()
+    builtins.__import__ = _timed_import
+
+
+def report():
+    """
+    Stops timing the imports and prints the time spent in the imports of each
+    package since ``start``.
+    """
+    global _original_import
+    if _original_import is None:
+        return
+    builtins.__import__ = _original_import
+    _original_import = None
+    total_time = time.perf_counter() - _start_time
+    import_time = sum(_self_times.values())
+
+    print("Startup profile:", flush=True)
+    print(f"    {'package':<30} {'import time (s)':>16} {'share':>8}")
+    ranked = sorted(_self_times.items(), key=lambda item: item[1], reverse=True)
+    for package, seconds in ranked[:REPORT_ENTRIES]:
+        share = seconds / total_time * 100 if total_time else 0.0
+        print(f"    {package:<30} {seconds:>16.3f} {share:>7.1f}%")
+    if len(ranked) > REPORT_ENTRIES:
+        rest = sum(seconds for _, seconds in ranked[REPORT_ENTRIES:])
+        print(f"    {f'({len(ranked) - REPORT_ENTRIES} more)':<30} {rest:>16.3f}")
+    print(f"    {'imports in total':<30} {import_time:>16.3f}")
+    print(f"    {'startup in total':<30} {total_time:>16.3f}", flush=True)
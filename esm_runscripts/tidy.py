@@ -2,14 +2,31 @@ import filecmp
 import os
 import sys
 import re
+import select
 import time
 import pathlib
 
 import psutil
 import shutil
 
-from . import coupler, database_actions, helpers
-from .filelists import copy_files, resolve_symlinks
+import esm_parser
+
+from . import (
+    coupler,
+    database_actions,
+    file_signatures,
+    finished_config,
+    helpers,
+    prefetch,
+    trash,
+)
+from .filelists import (
+    clear_symlink_cache,
+    copy_files,
+    file_movement_workers,
+    resolve_symlinks,
+    symlink_cache_info,
+)
 
 
 def run_job(config):
@@ -63,19 +80,43 @@ def copy_stuff_back_from_work(config):
 
 
 def wait_and_observe(config):
+    """
+    Waits for the process of the compute job (``general.launcher_pid``) to
+    finish, while checking its output for the triggers of
+    ``assemble_error_list``. The wait is event-driven (see ``ProcessWaiter``):
+    the tidy job wakes up when the process exits or when the next error check
+    is due according to its ``frequency``, and at least every
+    ``general.observe_interval`` seconds (600 by default) to report in the
+    monitor file.
+    """
     if config["general"]["submitted"]:
         monitor_file = config["general"]["monitor_file"]
-        thistime = 0
         error_check_list = assemble_error_list(config)
-        while job_is_still_running(config):
+        try:
+            next_run_prefetch = prefetch.start_prefetch(config)
+        except Exception as error:
+            # Prefetching is only an optimization, never stop observing the run
+            # because of it
+            monitor_file.write(f"prefetching failed: {error} \n")
+            next_run_prefetch = None
+        max_interval = config["general"].get("observe_interval", 600)
+        waiter = ProcessWaiter(config["general"]["launcher_pid"])
+        start_time = time.monotonic()
+        while waiter.is_running():
             monitor_file.write("still running \n")
-            config["general"]["next_test_time"] = thistime
+            config["general"]["next_test_time"] = time.monotonic() - start_time
             config = check_for_errors(config)
-            thistime = thistime + 10
-            time.sleep(10)
-        thistime = thistime + 100000000
-        config["general"]["next_test_time"] = thistime
+            next_checks = [error[3] for error in config["general"]["error_list"]]
+            timeout = max_interval
+            if next_checks:
+                timeout = min(
+                    timeout, min(next_checks) - (time.monotonic() - start_time)
+                )
+            waiter.wait(max(timeout, 0))
+        waiter.close()
+        config["general"]["next_test_time"] = time.monotonic() - start_time + 100000000
         config = check_for_errors(config)
+        config = prefetch.finish_prefetch(config, next_run_prefetch)
     return config
 
 
@@ -163,11 +204,132 @@ def assemble_error_list(config):
     return config
 
 
+class ErrorScanner:
+    """
+    Incremental, case-insensitive search of the ``check_error`` triggers in
+    the files they watch. The position up to which a file was searched is kept
+    for every trigger, and only the data appended since then is read. Triggers
+    of a file searched from the same position are searched in a single pass
+    with one compiled pattern. A trigger is reported as found once it appeared
+    anywhere in the file, as when the whole file was searched on every check.
+    """
+
+    # Bytes read at once, so that large logs are not loaded in memory at once
+    CHUNK_SIZE = 16 * 1024 * 1024
+
+    def __init__(self):
+        # Position up to which the file was searched, by (file, trigger)
+        self.offsets = {}
+        self.found = {}
+        self._patterns = {}
+
+    def _pattern(self, triggers):
+        key = frozenset(triggers)
+        if key not in self._patterns:
+            self._patterns[key] = re.compile(
+                "|".join(
+                    re.escape(trigger)
+                    for trigger in sorted(triggers, key=len, reverse=True)
+                ),
+                re.IGNORECASE,
+            )
+        return self._patterns[key]
+
+    def scan(self, search_file, triggers):
+        """
+        Reads the content of ``search_file`` not yet searched for ``triggers``
+        and returns the set of triggers found in the file so far.
+        """
+        found = self.found.setdefault(search_file, set())
+        try:
+            size = os.path.getsize(search_file)
+        except OSError:
+            return found
+        if any(
+            offset > size
+            for (offset_file, _), offset in self.offsets.items()
+            if offset_file == search_file
+        ):
+            # The file was truncated or replaced
+            found.clear()
+            for key in [key for key in self.offsets if key[0] == search_file]:
+                del self.offsets[key]
+
+        # Pending triggers, by the position they are searched from
+        pending = {}
+        for trigger in triggers:
+            if trigger not in found:
+                offset = self.offsets.get((search_file, trigger), 0)
+                pending.setdefault(offset, []).append(trigger)
+        for offset, offset_triggers in sorted(pending.items()):
+            end = self._search(search_file, offset, offset_triggers, found)
+            for trigger in offset_triggers:
+                self.offsets[(search_file, trigger)] = end
+        return found
+
+    def _search(self, search_file, offset, pending, found):
+        """
+        Searches ``search_file`` from ``offset`` on for the ``pending`` triggers
+        and adds those found to ``found``. Returns the position up to which the
+        file was searched.
+        """
+        pattern = self._pattern(pending)
+        # Bytes searched again after a chunk without a newline, so that a
+        # trigger split between two chunks is found in the second one
+        overlap = max(len(trigger.encode()) for trigger in pending) - 1
+        with open(search_file, "rb") as origin_file:
+            origin_file.seek(offset)
+            while pending:
+                data = origin_file.read(self.CHUNK_SIZE)
+                if not data:
+                    break
+                # Only complete lines are consumed. A partial last line is
+                # searched now and again once it is complete
+                consumed = data.rfind(b"\n") + 1
+                if not consumed and len(data) == self.CHUNK_SIZE:
+                    # A line longer than a chunk
+                    consumed = max(len(data) - overlap, 1)
+                text = data.decode(errors="replace")
+                for match in pattern.finditer(text):
+                    line_start = text.rfind("\n", 0, match.start()) + 1
+                    line_end = text.find("\n", match.end())
+                    line = text[line_start : None if line_end < 0 else line_end]
+                    line = line.upper()
+                    for trigger in pending:
+                        if trigger.upper() in line:
+                            found.add(trigger)
+                    pending = [trigger for trigger in pending if trigger not in found]
+                    if not pending:
+                        break
+                    pattern = self._pattern(pending)
+                offset += consumed
+                if len(data) < self.CHUNK_SIZE:
+                    break
+                origin_file.seek(offset)
+        return offset
+
+
 def check_for_errors(config):
     new_list = []
     error_check_list = config["general"]["error_list"]
     monitor_file = config["general"]["monitor_file"]
     time = config["general"]["next_test_time"]
+    scanner = config["general"].setdefault("error_scanner", ErrorScanner())
+
+    # Files with triggers due in this check are searched for all their
+    # triggers at once. Triggers found before they are due are remembered by
+    # the scanner, and reported once they are due
+    file_triggers = {}
+    due_files = set()
+    for trigger, search_file, _, next_check, _, _ in error_check_list:
+        file_triggers.setdefault(search_file, []).append(trigger)
+        if next_check <= time:
+            due_files.add(search_file)
+    found = {
+        search_file: scanner.scan(search_file, file_triggers[search_file])
+        for search_file in due_files
+    }
+
     for (
         trigger,
         search_file,
@@ -178,24 +340,20 @@ def check_for_errors(config):
     ) in error_check_list:
         warned = 0
         if next_check <= time:
-            if os.path.isfile(search_file):
-                with open(search_file) as origin_file:
-                    for line in origin_file:
-                        if trigger.upper() in line.upper():
-                            if method == "warn":
-                                warned = 1
-                                monitor_file.write("WARNING: " + message + "\n")
-                                break
-                            elif method == "kill":
-                                harakiri = "scancel " + config["general"]["jobid"]
-                                monitor_file.write("ERROR: " + message + "\n")
-                                monitor_file.write("Will kill the run now..." + "\n")
-                                monitor_file.flush()
-                                print("ERROR: " + message)
-                                print("Will kill the run now...", flush=True)
-                                database_actions.database_entry_crashed(config)
-                                os.system(harakiri)
-                                sys.exit(42)
+            if trigger in found.get(search_file, ()):
+                if method == "warn":
+                    warned = 1
+                    monitor_file.write("WARNING: " + message + "\n")
+                elif method == "kill":
+                    harakiri = "scancel " + config["general"]["jobid"]
+                    monitor_file.write("ERROR: " + message + "\n")
+                    monitor_file.write("Will kill the run now..." + "\n")
+                    monitor_file.flush()
+                    print("ERROR: " + message)
+                    print("Will kill the run now...", flush=True)
+                    database_actions.database_entry_crashed(config)
+                    os.system(harakiri)
+                    sys.exit(42)
             next_check += frequency
         if warned == 0:
             new_list.append(
@@ -206,11 +364,78 @@ def check_for_errors(config):
 
 
 def job_is_still_running(config):
-    if psutil.pid_exists(config["general"]["launcher_pid"]):
+    if psutil.pid_exists(int(config["general"]["launcher_pid"])):
         return True
     return False
 
 
+class ProcessWaiter:
+    """
+    Waits for a process that is not a child of this one to exit.
+
+    On Linux 5.3 and later (Python 3.9 and later) a pidfd of the process is
+    polled, which returns as soon as the process exits. Elsewhere, or if the
+    pidfd cannot be opened, ``psutil.pid_exists`` is polled with an adaptive
+    backoff: the interval starts at ``min_interval`` and is doubled up to
+    ``max_interval`` seconds.
+
+    Parameters
+    ----------
+    pid : int or str
+        Process ID to observe
+    min_interval : float
+        First polling interval of the fallback, in seconds
+    max_interval : float
+        Largest polling interval of the fallback, in seconds
+    """
+
+    def __init__(self, pid, min_interval=0.05, max_interval=10):
+        self.pid = int(pid)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.pidfd = None
+        self.poller = None
+        if self.pid > 0 and hasattr(os, "pidfd_open"):
+            try:
+                self.pidfd = os.pidfd_open(self.pid)
+                self.poller = select.poll()
+                self.poller.register(self.pidfd, select.POLLIN)
+            except OSError:
+                self.pidfd = None
+                self.poller = None
+
+    def is_running(self):
+        if self.poller:
+            return not self.poller.poll(0)
+        return self.pid > 0 and psutil.pid_exists(self.pid)
+
+    def wait(self, timeout):
+        """
+        Blocks until the process exits or ``timeout`` seconds have passed.
+
+        Returns
+        -------
+        exited : bool
+        """
+        if self.poller:
+            return bool(self.poller.poll(int(timeout * 1000)))
+        deadline = time.monotonic() + timeout
+        while self.is_running():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.interval, remaining))
+            self.interval = min(self.interval * 2, self.max_interval)
+        return True
+
+    def close(self):
+        if self.pidfd is not None:
+            os.close(self.pidfd)
+            self.pidfd = None
+            self.poller = None
+
+
 def _increment_date_and_run_number(config):
     config["general"]["run_number"] += 1
     config["general"]["current_date"] += config["general"]["delta_date"]
@@ -281,7 +506,15 @@ def clean_run_dir(config):
 
      * ``clean_size``: (int or float) Erases all files with size
        greater than ``clean_size``, must be specified in bytes! Compatible
-       with all the other options.
+       with all the other options. It can also be a dictionary with a size
+       per file type, see ``_clean_old_runs_size``. Use
+       ``clean_size_dry_run: True`` to only list the files.
+
+     * ``clean_async``: (bool) Instead of deleting the directories right
+       away, moves them into ``<experiment_dir>/.trash`` and lets a
+       detached process delete them, so that the next run does not wait for
+       the deletion (see ``trash.py``). ``clean_async_workers`` (int, 4 by
+       default) sets how many directories are deleted in parallel.
 
      Example
      -------
@@ -314,6 +547,10 @@ def clean_run_dir(config):
     _clean_old_rundirs_except(config)
     _clean_old_runs_filetypes(config)
     _clean_old_runs_size(config)
+    if config["general"].get("clean_async", False):
+        trash.start_worker(
+            trash.trash_dir(config), config["general"].get("clean_async_workers", 4)
+        )
     return config
 
 
@@ -380,9 +617,21 @@ def _clean_run_determine_user_choice(config):
         sys.exit(1)
 
 
+def _clean_dir(config, path):
+    """
+    Removes ``path`` with ``rm_r``, or moves it to the trash of the experiment
+    if ``general.clean_async`` is set. Paths that cannot be moved to the trash
+    are removed right away.
+    """
+    if config["general"].get("clean_async", False) and os.path.isdir(path):
+        if trash.move_to_trash(str(path), trash.trash_dir(config)):
+            return
+    rm_r(path)
+
+
 def _clean_this_rundir(config):
     if config["general"].get("clean_this_rundir", False):
-        rm_r(config["general"]["thisrun_dir"])
+        _clean_dir(config, config["general"]["thisrun_dir"])
 
 
 def _clean_old_rundirs_except(config):
@@ -433,27 +682,147 @@ def _clean_old_rundirs_except(config):
         runs_to_keep = set(all_run_folders_in_experiment)
     runs_to_clean = set(all_run_folders_in_experiment) - runs_to_keep
     for run in list(runs_to_clean):
-        rm_r(run)
+        _clean_dir(config, run)
 
 
 def _clean_old_runs_filetypes(config):
     all_filetypes = config["general"]["all_filetypes"]
     for filetype in all_filetypes:
         if config["general"].get("clean_" + filetype + "_dir", False):
-            rm_r(config["general"]["thisrun_" + filetype + "_dir"])
+            _clean_dir(config, config["general"]["thisrun_" + filetype + "_dir"])
 
 
-def _clean_old_runs_size(config):
+def _size_thresholds(config):
+    """
+    Reads ``general.clean_size`` and returns a dictionary with the size
+    threshold of each subfolder of the run folder, ``False`` meaning that its
+    files are never removed. If ``clean_size`` is a single number it is
+    returned under the key ``None``.
+    """
     rmsize = config["general"].get("clean_size", False)
-    if rmsize:
-        flist = []
-        for root, _, files in os.walk(config["general"]["thisrun_dir"]):
-            for file_ in files:
-                size = os.path.getsize(root + "/" + file_)
-                if size >= rmsize:
-                    flist.append(root + "/" + file_)
-        for file_ in flist:
-            os.remove(file_)
+    if not rmsize:
+        return {}
+    if isinstance(rmsize, dict):
+        thresholds = {}
+        for filetype, threshold in rmsize.items():
+            if threshold is False or threshold is None:
+                thresholds[filetype] = False
+                continue
+            if isinstance(threshold, bool) or not isinstance(threshold, (int, float)):
+                esm_parser.user_error(
+                    "clean_size",
+                    f"``clean_size.{filetype}`` is ``{threshold}``, but it must be "
+                    "a size in bytes or ``False``.",
+                )
+            thresholds[filetype] = threshold
+        return thresholds
+    return {None: rmsize}
+
+
+def _sweep_subtree(path, threshold):
+    """
+    Returns ``(path, size)`` for every file in ``path`` (or ``path`` itself,
+    if it is a file) with a size larger or equal than ``threshold``. Symlinks
+    are not followed nor reported, as removing them frees no space.
+    """
+    matches = []
+    try:
+        if not os.path.isdir(path) or os.path.islink(path):
+            if os.path.isfile(path) and not os.path.islink(path):
+                size = os.path.getsize(path)
+                if size >= threshold:
+                    matches.append((path, size))
+            return matches
+    except OSError:
+        return matches
+    stack = [path]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as scanned:
+                for entry in scanned:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        size = entry.stat(follow_symlinks=False).st_size
+                        if size >= threshold:
+                            matches.append((entry.path, size))
+        except OSError:
+            continue
+    return matches
+
+
+def _clean_old_runs_size(config):
+    """
+    Removes the files of the run folder larger or equal than
+    ``general.clean_size`` bytes. ``clean_size`` can be either a single size,
+    valid for all files, or a size per subfolder of the run folder, i.e. per
+    file type, with an optional ``default`` for all the other subfolders:
+
+    .. code-block:: yaml
+
+       general:
+               clean_size:
+                       outdata: 10000000000
+                       restart_out: False
+                       default: 50000000000
+
+    Subfolders are searched in parallel by ``general.file_movement_workers``
+    threads. With ``general.clean_size_dry_run: True`` the files are only
+    reported, not removed.
+    """
+    thresholds = _size_thresholds(config)
+    if not thresholds:
+        return
+    thisrun_dir = config["general"]["thisrun_dir"]
+    try:
+        with os.scandir(thisrun_dir) as scanned:
+            subtrees = [entry.name for entry in scanned]
+    except OSError:
+        return
+
+    sweeps = []
+    for name in subtrees:
+        if None in thresholds:
+            threshold = thresholds[None]
+        else:
+            threshold = thresholds.get(name, thresholds.get("default", False))
+        if threshold is not False:
+            sweeps.append((os.path.join(thisrun_dir, name), threshold))
+    workers, _ = file_movement_workers(config)
+    results = helpers.map_concurrently(_sweep_subtree, sweeps, workers, "thread")
+
+    dry_run = config["general"].get("clean_size_dry_run", False)
+    if dry_run:
+        print("clean_size dry run, these files would be removed:", flush=True)
+    total_size = 0
+    total_files = 0
+    for (subtree, _), matches in zip(sweeps, results):
+        subtree_size = 0
+        for file_, size in matches:
+            if dry_run:
+                print(f"    {size_bytes_to_human(size):>10}  {file_}", flush=True)
+            else:
+                try:
+                    os.remove(file_)
+                except OSError:
+                    continue
+            subtree_size += size
+        if matches and (dry_run or config["general"]["verbose"]):
+            print(
+                f"{os.path.basename(subtree)}: {len(matches)} files, "
+                f"{size_bytes_to_human(subtree_size)}",
+                flush=True,
+            )
+        total_size += subtree_size
+        total_files += len(matches)
+    if dry_run or config["general"]["verbose"]:
+        action = "would free" if dry_run else "freed"
+        print(
+            f"clean_size {action} {size_bytes_to_human(total_size)} "
+            f"in {total_files} files",
+            flush=True,
+        )
 
 
 def start_various_jobtypes_after_compute(config):
@@ -594,99 +963,213 @@ def throw_away_some_infiles(config):
 
 
 
-def copy_all_results_to_exp(config):
-    monitor_file = config["general"]["monitor_file"]
-    monitor_file.write("Copying stuff to main experiment folder \n")
-    for root, dirs, files in os.walk(config["general"]["thisrun_dir"], topdown=False):
+def _scan_run_tree(config):
+    """
+    Lists the files of the run folder that ``copy_all_results_to_exp`` has to
+    harvest, in a single ``os.scandir`` pass. Like ``os.walk``, symlinks to
+    directories are neither entered nor harvested. Files in ``work`` folders
+    and empty files are left out.
+
+    Returns
+    -------
+    files : list
+        ``(source, is_link)`` tuples
+    """
+    thisrun_work_dir = config["general"]["thisrun_work_dir"]
+    files = []
+    stack = [config["general"]["thisrun_dir"]]
+    while stack:
+        root = stack.pop()
+        try:
+            with os.scandir(root) as scanned:
+                entries = list(scanned)
+        except OSError:
+            continue
+        skip_files = root.startswith(thisrun_work_dir) or root.endswith("/work")
         if config["general"]["verbose"]:
             print("Working on folder: " + root)
-        if root.startswith(config["general"]["thisrun_work_dir"]) or root.endswith(
-            "/work"
-        ):
-            if config["general"]["verbose"]:
+            if skip_files:
                 print("Skipping files in work.")
-            continue
-
-        for name in files:
-            source = os.path.join(root, name)
-           
-            if not os.stat(source).st_size > 0: # skip empty files
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                if not entry.is_symlink():
+                    stack.append(os.path.join(root, entry.name))
                 continue
+            if skip_files:
+                continue
+            try:
+                if not entry.stat().st_size > 0:  # skip empty files
+                    continue
+            except OSError:
+                continue
+            files.append((os.path.join(root, entry.name), entry.is_symlink()))
+    return files
 
-            if config["general"]["verbose"]:
-                print("File: " + source)
-            destination = source.replace(
-                config["general"]["thisrun_dir"], config["general"]["experiment_dir"]
+
+def _harvest_file(config, source, destination, known):
+    """
+    Moves the regular file ``source`` from the run folder to ``destination``
+    in the experiment folder. If a different file already exists there, the
+    old one is renamed with the datestamp of the last run, the new one with the
+    datestamp of this run, and ``destination`` becomes a link to the latter.
+
+    Returns
+    -------
+    entry : dict or None
+        New entry for the file signatures record, if ``source`` was found to
+        be identical to ``destination`` by comparing the files
+    """
+    verbose = config["general"]["verbose"]
+    if verbose:
+        print("File: " + source)
+    if os.path.isfile(destination):
+        entry = None
+        identical = file_signatures.compare(known, source, destination)
+        if identical is None:
+            identical = filecmp.cmp(source, destination)
+            if identical:
+                entry = file_signatures.make_entry(source, destination)
+        if identical:
+            if verbose:
+                print("File " + source + " has not changed, skipping.")
+            return entry
+        if os.path.isfile(destination + "_" + config["general"]["run_datestamp"]):
+            print("Don't know where to move " + destination + ", file exists")
+            return None
+        if os.path.islink(destination):
+            os.remove(destination)
+        else:
+            os.rename(
+                destination,
+                destination + "_" + config["general"]["last_run_datestamp"],
             )
-            destination_path = destination.rsplit("/", 1)[0]
-            if not os.path.exists(destination_path):
-                os.makedirs(destination_path)
-            if not os.path.islink(source):
-                if os.path.isfile(destination):
-                    if filecmp.cmp(source, destination):
-                        if config["general"]["verbose"]:
-                            print("File " + source + " has not changed, skipping.")
-                        continue
-                    else:
-                        if os.path.isfile(
-                            destination + "_" + config["general"]["run_datestamp"]
-                        ):
-                            print(
-                                "Don't know where to move "
-                                + destination
-                                + ", file exists"
-                            )
-                            continue
-                        else:
-                            if os.path.islink(destination):
-                                os.remove(destination)
-                            else:
-                                os.rename(
-                                    destination,
-                                    destination
-                                    + "_"
-                                    + config["general"]["last_run_datestamp"],
-                                )
-                            newdestination = (
-                                destination + "_" + config["general"]["run_datestamp"]
-                            )
-                            if config["general"]["verbose"]:
-                                print("Moving file " + source + " to " + newdestination)
-                            os.rename(source, newdestination)
-                            os.symlink(newdestination, destination)
-                            continue
-                try:
-                    if config["general"]["verbose"]:
-                        print("Moving file " + source + " to " + destination)
-                    try:
-                        os.rename(source, destination)
-                    except:  # Fill is still open... create a hard (!) link instead
-                        os.link(source, destination)
-
-                except:
-                    print(
-                        ">>>>>>>>>  Something went wrong moving "
-                        + source
-                        + " to "
-                        + destination
-                    )
-            else:
-                linkdest = resolve_symlinks(source,config["general"]["verbose"])
-                #newlinkdest = (
-                #    destination.rsplit("/", 1)[0] + "/" + linkdest.rsplit("/", 1)[-1]
-                #)
-                if os.path.islink(destination):
-                    destdest = resolve_symlinks(source,config["general"]["verbose"])
-                    if linkdest == destdest:
-                        # both links are identical, skip
-                        continue
-                    #os.remove(destination)
-                if os.path.isfile(destination):
-                    os.rename(
-                        destination,
-                        destination + "_" + config["general"]["last_run_datestamp"],
-                    )
-                os.symlink(linkdest, destination)
+        newdestination = destination + "_" + config["general"]["run_datestamp"]
+        if verbose:
+            print("Moving file " + source + " to " + newdestination)
+        os.rename(source, newdestination)
+        os.symlink(newdestination, destination)
+        return None
+    try:
+        if verbose:
+            print("Moving file " + source + " to " + destination)
+        try:
+            os.rename(source, destination)
+        except:  # Fill is still open... create a hard (!) link instead
+            os.link(source, destination)
+    except:
+        print(">>>>>>>>>  Something went wrong moving " + source + " to " + destination)
+    return None
+
+
+def _harvest_link(config, source, destination):
+    """
+    Recreates the symlink ``source`` of the run folder at ``destination``,
+    pointing to the file ``source`` resolves to.
+    """
+    linkdest = resolve_symlinks(source, config["general"]["verbose"])
+    if os.path.islink(destination):
+        destdest = resolve_symlinks(source, config["general"]["verbose"])
+        if linkdest == destdest:
+            # both links are identical, skip
+            return
+    if os.path.isfile(destination):
+        os.rename(
+            destination,
+            destination + "_" + config["general"]["last_run_datestamp"],
+        )
+    os.symlink(linkdest, destination)
+
+
+def _harvest_directory(config, actions):
+    """
+    Runs the harvest ``actions`` of one destination directory, one after the
+    other. Returns the new entries for the file signatures record.
+    """
+    entries = []
+    for source, destination, is_link, known in actions:
+        if is_link:
+            _harvest_link(config, source, destination)
+        else:
+            entries.append(_harvest_file(config, source, destination, known))
+    return entries
+
+
+def copy_all_results_to_exp(config):
+    """
+    Harvests the results of the run folder into the experiment folder, in four
+    phases:
+
+    1. ``scan``: the run folder is listed once (see ``_scan_run_tree``),
+    2. ``plan``: the destination of every file is computed,
+    3. ``mkdir``: all destination directories are created,
+    4. ``move``: files are moved or linked (see ``_harvest_file`` and
+       ``_harvest_link``). Destination directories are processed concurrently
+       by ``general.file_movement_workers`` threads, the files of one
+       directory one after the other.
+
+    The duration of each phase is written to the monitor file.
+    """
+    monitor_file = config["general"]["monitor_file"]
+    monitor_file.write("Copying stuff to main experiment folder \n")
+    signatures = file_signatures.get_file_signatures(config)
+    # Links may have been changed since the last harvest or copy
+    clear_symlink_cache()
+    timings = []
+
+    phase_start = time.monotonic()
+    files = _scan_run_tree(config)
+    timings.append(("scan", time.monotonic() - phase_start))
+
+    phase_start = time.monotonic()
+    plan = {}
+    for source, is_link in files:
+        destination = source.replace(
+            config["general"]["thisrun_dir"], config["general"]["experiment_dir"]
+        )
+        known = signatures.get(destination) if signatures and not is_link else None
+        plan.setdefault(destination.rsplit("/", 1)[0], []).append(
+            (source, destination, is_link, known)
+        )
+    timings.append(("plan", time.monotonic() - phase_start))
+
+    phase_start = time.monotonic()
+    for destination_path in plan:
+        os.makedirs(destination_path, exist_ok=True)
+    timings.append(("mkdir", time.monotonic() - phase_start))
+
+    phase_start = time.monotonic()
+    workers, _ = file_movement_workers(config)
+    results = helpers.map_concurrently(
+        _harvest_directory,
+        [(config, actions) for actions in plan.values()],
+        workers,
+        "thread",
+    )
+    if signatures:
+        for entries in results:
+            for entry in entries:
+                signatures.update(entry)
+        signatures.save()
+    timings.append(("move", time.monotonic() - phase_start))
+
+    monitor_file.write(
+        f"Harvested {len(files)} files into {len(plan)} directories: "
+        + ", ".join(f"{phase} {duration:.3f} s" for phase, duration in timings)
+        + " \n"
+    )
+    if config["general"]["verbose"]:
+        print(f"Symlink resolution cache: {symlink_cache_info()}")
+
+    # Only now that the finished config is in the experiment folder, so that the
+    # index is written after the folder changed (see ``find_finished_configs``)
+    try:
+        finished_config.record_finished_config(config)
+    except OSError as error:
+        monitor_file.write(f"Could not index the finished config: {error} \n")
     return config
 
 
@@ -0,0 +1,132 @@
+"""
+Asynchronous deletion of experiment folders.
+
+With ``general.clean_async: True``, the ``clean_`` options of
+``tidy.clean_run_dir`` do not delete folders in place. The folders are renamed
+into the ``.trash`` folder of the experiment, which is instantaneous, and a
+detached worker process deletes the content of ``.trash`` while the next run is
+already being prepared. At most ``general.clean_async_workers`` folders (4 by
+default) are deleted in parallel.
+
+The trash is a persistent queue: if the worker is killed, what is left in
+``.trash`` is deleted by the worker started by the next tidy job. Only one
+worker runs per experiment at a time, which is ensured with a lock on
+``.trash/.lock``.
+
+This file is also the worker itself (``python trash.py <trash_dir>``). It is run
+as a script, and not as ``python -m esm_runscripts.trash``, so that the worker
+does not need to import the whole ``esm_runscripts`` package.
+"""
+import argparse
+import concurrent.futures
+import os
+import shutil
+import subprocess
+import sys
+import uuid
+
+LOCK_NAME = ".lock"
+
+
+def trash_dir(config):
+    return os.path.join(config["general"]["experiment_dir"], ".trash")
+
+
+def move_to_trash(path, trash):
+    """
+    Renames ``path`` into ``trash``, under its name with a unique suffix.
+
+    Returns
+    -------
+    moved : bool
+        ``False`` if ``path`` could not be renamed, i.e. because it is on a
+        different filesystem than ``trash``.
+    """
+    os.makedirs(trash, exist_ok=True)
+    name = f"{os.path.basename(path.rstrip('/'))}.{uuid.uuid4().hex}"
+    try:
+        os.rename(path, os.path.join(trash, name))
+    except OSError:
+        return False
+    return True
+
+
+def start_worker(trash, workers=4):
+    """
+    Starts a worker deleting the content of ``trash``, detached from the
+    current process so that it survives the end of the tidy job.
+    """
+    if not os.path.isdir(trash):
+        return None
+    with open(os.devnull, "r+b") as devnull:
+        return subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), trash, "--workers", str(workers)],
+            stdin=devnull,
+            stdout=devnull,
+            stderr=devnull,
+            close_fds=True,
+            start_new_session=True,
+        )
+
+
+def _remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def empty_trash(trash, workers=4):
+    """
+    Deletes the content of ``trash`` until it is empty, with at most
+    ``workers`` parallel deletions. The parallelism is over the content of the
+    trashed folders, so that a single large run folder is also deleted in
+    parallel.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            trashed = [
+                os.path.join(trash, name)
+                for name in os.listdir(trash)
+                if name != LOCK_NAME
+            ]
+            if not trashed:
+                return
+            paths = []
+            for path in trashed:
+                if os.path.isdir(path) and not os.path.islink(path):
+                    try:
+                        paths.extend(
+                            os.path.join(path, child) for child in os.listdir(path)
+                        )
+                    except OSError:
+                        pass
+            list(executor.map(_remove, paths))
+            list(executor.map(_remove, trashed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Empties an experiment trash")
+    parser.add_argument("trash", help="Path of the .trash folder")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    import fcntl
+
+    lock_file = open(os.path.join(args.trash, LOCK_NAME), "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        # Another worker is already emptying this trash
+        return
+    except OSError:
+        # Filesystem without support for locks, go on without it
+        pass
+    empty_trash(args.trash, max(args.workers, 1))
+
+
+if __name__ == "__main__":
+    main()
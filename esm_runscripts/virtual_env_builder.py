@@ -1,9 +1,6 @@
 import datetime
 import os
 import site
-
-import questionary
-
 import pathlib
 import subprocess
 import sys
@@ -219,6 +216,9 @@ def find_package(pkg):
     return pool_root
 
 def _integorate_user_venv(config):
+    # NOTE: imported here, only interactive runs need it
+    import questionary
+
     questionary.print("\t"+100*"=")
     questionary.print("\t\tRunning jobs can optionally be encapsulated into a virtual environment\n")
     questionary.print("\t\tThis shields the run from changes made to the remainder of the ESM-Tool installation\n")
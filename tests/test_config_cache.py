@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+"""Tests for the reuse of parsed configurations of `esm_runscripts.config_cache`."""
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from esm_runscripts import cli, config_cache
+
+
+class TestConfigCache(unittest.TestCase):
+    """Tests for the memory and disk caches of parsed configurations."""
+
+    def setUp(self):
+        """Creates an experiment with a runscript and a configuration folder."""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.function_path = os.path.join(self.tmp_dir, "configs")
+        self.config_file = os.path.join(self.function_path, "echam", "echam.yaml")
+        self.exp_dir = os.path.join(self.tmp_dir, "exp")
+        self.runscript = os.path.join(self.exp_dir, "scripts", "run.yaml")
+        os.makedirs(os.path.dirname(self.config_file))
+        os.makedirs(os.path.dirname(self.runscript))
+        open(os.path.join(self.exp_dir, ".top_of_exp_tree"), "w").close()
+        self.write(self.config_file, "model: echam\n")
+        self.write(self.runscript, "general:\n    expid: exp\n")
+
+        patcher = mock.patch.object(
+            config_cache.esm_rcfile,
+            "EsmToolsDir",
+            lambda name: self.function_path,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        config_cache._warm_configs.clear()
+
+        self.command_line_config = {
+            "runscript_abspath": self.runscript,
+            "started_from": os.path.dirname(self.runscript) + "/",
+            "jobtype": "compute",
+            "last_jobtype": "prepcompute",
+            "use_venv": None,
+            "verbose": False,
+            "launcher_pid": 1234,
+            "original_command": "run.yaml -e exp",
+            "no_config_cache": False,
+        }
+        self.config = {
+            "general": {
+                "config_cache": True,
+                "warm_resubmit": True,
+                "experiment_dir": self.exp_dir,
+                "additional_files": [],
+                "jobtype": "compute",
+            },
+            "computer": {"jobtype": "compute"},
+        }
+
+    def tearDown(self):
+        """Removes the experiment."""
+        shutil.rmtree(self.tmp_dir)
+        config_cache._warm_configs.clear()
+
+    def write(self, path, content):
+        with open(path, "w") as written:
+            written.write(content)
+
+    def store(self):
+        config_cache.store_warm_config(
+            self.config, self.command_line_config, {"general": {}}
+        )
+        config_cache.store_cached_config(
+            self.config, self.command_line_config, {"general": {}}
+        )
+
+    def load(self, **options):
+        return config_cache.load_cached_config(
+            dict(self.command_line_config, **options)
+        )
+
+    def test_hit(self):
+        """Volatile options do not change the entry, the command line is applied."""
+        self.store()
+        config = self.load(launcher_pid=5678, original_command="run.yaml")
+        self.assertIsNotNone(config)
+        self.assertEqual(config["general"]["launcher_pid"], 5678)
+        self.assertEqual(config["computer"]["jobtype"], "compute")
+
+    def test_opt_in(self):
+        """Nothing is cached on disk without ``general.config_cache``."""
+        del self.config["general"]["config_cache"]
+        self.store()
+        self.assertFalse(os.path.isdir(os.path.join(self.exp_dir, ".config_cache")))
+        self.assertIsNone(self.load())
+
+    def test_runscript_edit(self):
+        """An edited runscript misses the cache."""
+        self.store()
+        self.write(self.runscript, "general:\n    expid: new\n")
+        self.assertIsNone(self.load())
+
+    def test_config_file_edit(self):
+        """A configuration file with a new content misses the cache, even with
+        the same size and modification time."""
+        self.store()
+        stat = os.stat(self.config_file)
+        self.write(self.config_file, "model: ECHAM\n")
+        os.utime(self.config_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertIsNone(self.load())
+
+    def test_jobtype(self):
+        """A different job type misses the cache."""
+        self.store()
+        self.assertIsNone(self.load(jobtype="post"))
+        self.assertIsNone(self.load(last_jobtype="compute"))
+
+    def test_cache_key(self):
+        """The key depends on the job types, not on the volatile options."""
+        key = config_cache.cache_key(self.command_line_config)
+        for option, value in [
+            ("launcher_pid", 5678),
+            ("original_command", "run.yaml"),
+            ("no_config_cache", True),
+        ]:
+            self.assertEqual(
+                config_cache.cache_key(
+                    dict(self.command_line_config, **{option: value})
+                ),
+                key,
+            )
+        for option, value in [("jobtype", "tidy"), ("last_jobtype", "compute")]:
+            self.assertNotEqual(
+                config_cache.cache_key(
+                    dict(self.command_line_config, **{option: value})
+                ),
+                key,
+            )
+
+    def test_fingerprint(self):
+        """The content fingerprint sees changes the stat fingerprint misses."""
+        files = [self.config_file]
+        by_stat = config_cache.input_fingerprint(files)
+        by_content = config_cache.input_fingerprint(files, content=True)
+        stat = os.stat(self.config_file)
+        self.write(self.config_file, "model: ECHAM\n")
+        os.utime(self.config_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(config_cache.input_fingerprint(files), by_stat)
+        self.assertNotEqual(
+            config_cache.input_fingerprint(files, content=True), by_content
+        )
+
+    def test_no_config_cache(self):
+        """``--no-config-cache`` bypasses both caches."""
+        self.store()
+        self.assertIsNotNone(config_cache.get_warm_config(self.command_line_config))
+        self.assertIsNotNone(self.load())
+        command_line_config = dict(self.command_line_config, no_config_cache=True)
+        self.assertIsNone(config_cache.get_warm_config(command_line_config))
+        self.assertIsNone(config_cache.load_cached_config(command_line_config))
+
+    def test_command_line_option(self):
+        """``--no-config-cache`` is read from the command line."""
+        with mock.patch.object(sys, "argv", ["esm_runscripts", "run.yaml"]):
+            self.assertFalse(cli.parse_shargs().no_config_cache)
+        with mock.patch.object(
+            sys, "argv", ["esm_runscripts", "run.yaml", "--no-config-cache"]
+        ):
+            self.assertTrue(cli.parse_shargs().no_config_cache)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+"""Tests for the table of files of `esm_runscripts.file_manifest`."""
+
+
+import unittest
+
+from esm_runscripts.file_manifest import FileManifest, get_manifest
+
+
+def paths(manifest, block):
+    return [(entry.model, entry.category, entry.get(block)) for entry in manifest]
+
+
+class TestFileManifest(unittest.TestCase):
+    """Tests for `FileManifest`."""
+
+    def setUp(self):
+        """Creates a small assembled config with two models."""
+        self.config = {
+            "general": {
+                "valid_model_names": ["echam", "fesom"],
+                "scripts_sources": {"run": "/exp/scripts/run.yaml"},
+            },
+            "echam": {
+                "input_sources": {"ozone": "/pool/ozone.nc", "grid": "/pool/grid.nc"},
+                "input_intermediate": {
+                    "grid": "/exp/run/input/grid.nc",
+                    "ozone": "/exp/run/input/ozone.nc",
+                },
+                "input_targets": {
+                    "ozone": "/exp/run/work/ozone.nc",
+                    "grid": "/exp/run/work/grid.nc",
+                },
+                "forcing_sources": {},
+                "forcing_targets": {},
+                "restart_in_sources": {"rst": "/exp/restart/rst.nc"},
+                "model_dir": "/models/echam",
+            },
+            "fesom": {
+                "input_sources": {"mesh": "/pool/mesh.out"},
+                "input_targets": {"mesh": "/exp/run/work/mesh.out"},
+            },
+        }
+        self.manifest = FileManifest.build(self.config)
+
+    def test_select_sources(self):
+        """Entries are ordered by file type, model and category of the block."""
+        selected = self.manifest.select(self.config, ["restart_in", "input"])
+        self.assertEqual(
+            paths(selected, "sources"),
+            [
+                ("echam", "rst", "/exp/restart/rst.nc"),
+                ("echam", "ozone", "/pool/ozone.nc"),
+                ("echam", "grid", "/pool/grid.nc"),
+                ("fesom", "mesh", "/pool/mesh.out"),
+            ],
+        )
+        self.assertEqual(
+            selected.blocks,
+            [("echam", "restart_in"), ("echam", "input"), ("fesom", "input")],
+        )
+
+    def test_select_block(self):
+        """The categories are taken from the selected block."""
+        selected = self.manifest.select(self.config, ["input"], "intermediate")
+        self.assertEqual(
+            paths(selected, "intermediate"),
+            [
+                ("echam", "grid", "/exp/run/input/grid.nc"),
+                ("echam", "ozone", "/exp/run/input/ozone.nc"),
+            ],
+        )
+        self.assertEqual(selected[0].source, "/pool/grid.nc")
+        self.assertEqual(selected[0].target, "/exp/run/work/grid.nc")
+
+    def test_empty_block(self):
+        """Empty blocks are listed, without entries."""
+        selected = self.manifest.select(self.config, ["forcing"], "targets")
+        self.assertEqual(list(selected), [])
+        self.assertEqual(selected.blocks, [("echam", "forcing")])
+
+    def test_movement(self):
+        """The movement is set on copies of the entries."""
+        selected = self.manifest.select(
+            self.config,
+            ["input"],
+            movement=lambda model, category, filetype: f"{model}_{category}",
+        )
+        self.assertEqual(
+            [entry.movement for entry in selected],
+            ["echam_ozone", "echam_grid", "fesom_mesh"],
+        )
+        self.assertIsNone(self.manifest.select(self.config, ["input"])[0].movement)
+
+    def test_add(self):
+        """Files and blocks added after building are selected too."""
+        self.manifest.add("fesom", "input", "forcing", sources="/pool/forcing.nc")
+        self.manifest.add_block("general", "unknown", "sources", {"x": "/work/x"})
+        selected = self.manifest.select(self.config, ["input", "unknown"])
+        self.assertEqual(
+            paths(selected, "sources")[-3:],
+            [
+                ("fesom", "mesh", "/pool/mesh.out"),
+                ("fesom", "forcing", "/pool/forcing.nc"),
+                ("general", "x", "/work/x"),
+            ],
+        )
+
+    def test_from_config(self):
+        """Building and selecting at once gives the same entries."""
+        for key in ["sources", "intermediate", "targets"]:
+            self.assertEqual(
+                paths(FileManifest.from_config(self.config, ["input"], key), key),
+                paths(self.manifest.select(self.config, ["input"], key), key),
+            )
+
+    def test_get_manifest(self):
+        """The manifest is built once and kept in the config."""
+        manifest = get_manifest(self.config)
+        self.assertIs(self.config["general"]["file_manifest"], manifest)
+        self.assertIs(get_manifest(self.config), manifest)
+
+
+if __name__ == "__main__":
+    unittest.main()
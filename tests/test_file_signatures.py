@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+"""Tests for the record of staged files of `esm_runscripts.file_signatures`."""
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from esm_runscripts import file_signatures
+
+
+class TestFileSignatures(unittest.TestCase):
+    """Tests for `compare` and `FileSignatures`."""
+
+    def setUp(self):
+        """Creates a source file and its copy in a run folder."""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmp_dir, "pool", "grid.nc")
+        self.target = os.path.join(
+            self.tmp_dir, "exp", "run_20000101-20001231", "input", "grid.nc"
+        )
+        self.record_path = os.path.join(self.tmp_dir, "exp", "log", "signatures.jsonl")
+        for path in [self.source, self.target]:
+            os.makedirs(os.path.dirname(path))
+            with open(path, "w") as staged:
+                staged.write("grid" * 100)
+
+    def tearDown(self):
+        """Removes the files."""
+        shutil.rmtree(self.tmp_dir)
+
+    def change(self, path, content):
+        with open(path, "w") as changed:
+            changed.write(content)
+        # A different modification time, also on filesystems with coarse times
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    def test_record_key(self):
+        """Targets of run folders are recorded independently of the run."""
+        self.assertEqual(
+            file_signatures.record_key("/exp/run_20000101-20001231/input/grid.nc"),
+            "/exp/run_*/input/grid.nc",
+        )
+        self.assertEqual(
+            file_signatures.record_key("/exp/input/grid.nc"), "/exp/input/grid.nc"
+        )
+
+    def test_matching_file(self):
+        """Unchanged files are identical."""
+        entry = file_signatures.make_entry(self.source, self.target)
+        self.assertIs(file_signatures.compare(entry, self.source, self.target), True)
+
+    def test_changed_source(self):
+        """A source with a different size or content is known to differ."""
+        entry = file_signatures.make_entry(self.source, self.target)
+        self.change(self.source, "grid" * 101)
+        self.assertIs(file_signatures.compare(entry, self.source, self.target), False)
+        self.change(self.source, "GRID" * 100)
+        self.assertIs(file_signatures.compare(entry, self.source, self.target), False)
+
+    def test_unknown_file(self):
+        """Without a valid entry the record cannot tell."""
+        entry = file_signatures.make_entry(self.source, self.target)
+        self.assertIsNone(file_signatures.compare(None, self.source, self.target))
+        other_target = self.target.replace("run_20000101-20001231", "run_20010101-20011231")
+        self.assertIsNone(file_signatures.compare(entry, self.source, other_target))
+        self.change(self.target, "grid" * 100)
+        self.assertIsNone(file_signatures.compare(entry, self.source, self.target))
+
+    def test_next_run(self):
+        """The entry of the next run replaces the one of the previous run."""
+        signatures = file_signatures.FileSignatures(self.record_path)
+        signatures.update(file_signatures.make_entry(self.source, self.target))
+        signatures.save()
+        next_target = self.target.replace("run_20000101", "run_20010101")
+        os.makedirs(os.path.dirname(next_target))
+        shutil.copy2(self.source, next_target)
+        self.assertIsNone(signatures.get(next_target))
+        signatures.update(file_signatures.make_entry(self.source, next_target))
+        signatures.save()
+
+        reloaded = file_signatures.FileSignatures(self.record_path)
+        self.assertEqual(len(reloaded.entries), 1)
+        self.assertIsNone(reloaded.get(self.target))
+        self.assertIs(
+            file_signatures.compare(
+                reloaded.get(next_target), self.source, next_target
+            ),
+            True,
+        )
+
+    def test_compaction(self):
+        """Outdated lines and entries of removed targets are dropped."""
+        signatures = file_signatures.FileSignatures(self.record_path)
+        entry = file_signatures.make_entry(self.source, self.target)
+        removed = dict(entry, target=os.path.join(self.tmp_dir, "removed.nc"))
+        signatures.update(removed)
+        for _ in range(1100):
+            signatures.update(entry)
+            signatures.save()
+        with open(self.record_path) as record:
+            lines = record.readlines()
+        self.assertLess(len(lines), 1100)
+
+        reloaded = file_signatures.FileSignatures(self.record_path)
+        self.assertEqual(list(reloaded.entries), [file_signatures.record_key(self.target)])
+        self.assertEqual(reloaded.get(self.target), entry)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+"""Tests for the section index of `esm_runscripts.finished_config`."""
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import yaml
+
+from esm_runscripts import finished_config
+
+
+class TestWriteIndex(unittest.TestCase):
+    """Tests for `write_index` and `load_sections`."""
+
+    def setUp(self):
+        """Creates a folder for the finished config."""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.config_path = os.path.join(self.tmp_dir, "e_finished_config.yaml")
+        finished_config._section_cache.clear()
+
+    def tearDown(self):
+        """Removes the finished config."""
+        shutil.rmtree(self.tmp_dir)
+        finished_config._section_cache.clear()
+
+    def write_config(self, config):
+        with open(self.config_path, "w") as config_file:
+            yaml.dump(config, config_file)
+        finished_config.write_index(self.config_path, config)
+        return finished_config.read_index(self.config_path)
+
+    def test_plain_keys(self):
+        """Every top-level key gets its own range."""
+        ranges = self.write_config({"general": {"z": 3}, "oifs": {"w": 4}})
+        self.assertEqual(sorted(ranges), ["general", "oifs"])
+        self.assertEqual(ranges["general"][1], ranges["oifs"][0])
+
+    def test_key_with_colon(self):
+        """Keys after a key containing a colon are still indexed."""
+        ranges = self.write_config(
+            {"a": {"x": 1}, "esm:x": {"y": 2}, "general": {"z": 3}, "oifs": {"w": 4}}
+        )
+        self.assertEqual(sorted(ranges), ["a", "esm:x", "general", "oifs"])
+        self.assertEqual(
+            finished_config.load_sections(self.config_path, ["general", "oifs"]),
+            {"general": {"z": 3}, "oifs": {"w": 4}},
+        )
+
+    def test_quoted_key(self):
+        """A quoted key is part of the range before it, later keys are indexed."""
+        config = {"1": [1, 2], "a": 1, "b: c": {"k": "v"}, "general": {"z": 3}}
+        ranges = self.write_config(config)
+        self.assertEqual(sorted(ranges), ["a", "general"])
+        self.assertEqual(
+            finished_config.load_sections(self.config_path, ["a", "general"]),
+            {"a": 1, "general": {"z": 3}},
+        )
+
+    def test_no_index(self):
+        """Without a valid index the whole file is loaded."""
+        config = {"general": {"z": 3}, "oifs": {"w": 4}}
+        self.write_config(config)
+        with open(self.config_path, "a") as config_file:
+            config_file.write("echam:\n  v: 5\n")
+        self.assertIsNone(finished_config.read_index(self.config_path))
+        self.assertEqual(
+            finished_config.load_sections(self.config_path, ["general"]),
+            dict(config, echam={"v": 5}),
+        )
+
+
+class TestFindFinishedConfigs(unittest.TestCase):
+    """Tests for `record_finished_config` and `find_finished_configs`."""
+
+    def setUp(self):
+        """Creates a config folder with the finished config of one run."""
+        self.config_dir = tempfile.mkdtemp()
+        self.config = {
+            "general": {
+                "experiment_config_dir": self.config_dir,
+                "expid": "e",
+                "run_datestamp": "20000101-20000131",
+                "end_date": "2000-01-31",
+                "valid_model_names": ["echam"],
+            }
+        }
+        self.touch("e_finished_config.yaml_20000101-20000131")
+        finished_config.record_finished_config(self.config)
+        # As if the run ended a while ago
+        now = time.time()
+        os.utime(self.config_dir, (now - 20, now - 20))
+        index_path = os.path.join(self.config_dir, "finished_configs.idx")
+        os.utime(index_path, (now - 10, now - 10))
+
+    def tearDown(self):
+        """Removes the config folder."""
+        shutil.rmtree(self.config_dir)
+
+    def touch(self, name):
+        open(os.path.join(self.config_dir, name), "w").close()
+
+    def test_indexed(self):
+        """Configs are found through the index."""
+        self.assertEqual(
+            finished_config.find_finished_configs(self.config_dir, "20000131"),
+            ["e_finished_config.yaml_20000101-20000131"],
+        )
+        self.assertEqual(
+            finished_config.find_finished_configs(self.config_dir, "20000229"), []
+        )
+
+    def test_copied_by_hand(self):
+        """A config copied into the folder after the index is not shadowed."""
+        self.touch("e_finished_config.yaml_20000101-20000131_restored")
+        self.assertIsNone(
+            finished_config.find_finished_configs(self.config_dir, "20000131")
+        )
+
+    def test_missing_file(self):
+        """A config of the index that was removed is not returned."""
+        os.remove(
+            os.path.join(self.config_dir, "e_finished_config.yaml_20000101-20000131")
+        )
+        self.assertIsNone(
+            finished_config.find_finished_configs(self.config_dir, "20000131")
+        )
+
+    def test_not_moved_yet(self):
+        """A run whose config is not in the folder is not indexed."""
+        self.config["general"]["run_datestamp"] = "20000201-20000229"
+        finished_config.record_finished_config(self.config)
+        with open(os.path.join(self.config_dir, "finished_configs.idx")) as index:
+            self.assertNotIn("20000229", index.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
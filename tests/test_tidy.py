@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+"""Tests for the error checks of `esm_runscripts.tidy`."""
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from esm_runscripts.tidy import ErrorScanner
+
+
+class TestErrorScanner(unittest.TestCase):
+    """Tests for `ErrorScanner`."""
+
+    def setUp(self):
+        """Creates a log file to scan."""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.tmp_dir, "model.log")
+        self.write("step 1\nFATAL: out of bounds\nstep 2\n")
+
+    def tearDown(self):
+        """Removes the log file."""
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, text, mode="a"):
+        with open(self.log_file, mode) as log:
+            log.write(text)
+
+    def test_trigger_scanned_later(self):
+        """A trigger scanned for after another one still sees the whole file."""
+        scanner = ErrorScanner()
+        self.assertEqual(scanner.scan(self.log_file, ["error"]), set())
+        self.assertEqual(scanner.scan(self.log_file, ["FATAL"]), {"FATAL"})
+        self.assertEqual(scanner.scan(self.log_file, ["error"]), {"FATAL"})
+
+    def test_appended_lines(self):
+        """Lines appended after a scan are found, case-insensitively."""
+        scanner = ErrorScanner()
+        self.assertEqual(scanner.scan(self.log_file, ["error", "FATAL"]), {"FATAL"})
+        self.write("an Error occurred\n")
+        self.assertEqual(
+            scanner.scan(self.log_file, ["error", "FATAL"]), {"FATAL", "error"}
+        )
+
+    def test_truncated_file(self):
+        """A file that was replaced by a shorter one is searched again."""
+        scanner = ErrorScanner()
+        self.write("padding\n" * 10)
+        self.assertEqual(scanner.scan(self.log_file, ["error", "FATAL"]), {"FATAL"})
+        self.write("error\n", mode="w")
+        self.assertEqual(scanner.scan(self.log_file, ["error", "FATAL"]), {"error"})
+
+    def test_long_line(self):
+        """A trigger split between two chunks of a long line is found."""
+        scanner = ErrorScanner()
+        scanner.CHUNK_SIZE = 8
+        self.write("0123456ERROR789\n", mode="w")
+        self.assertEqual(scanner.scan(self.log_file, ["error"]), {"error"})
+
+    def test_long_line_appended(self):
+        """A trigger at the end of a long line still being written is found."""
+        scanner = ErrorScanner()
+        scanner.CHUNK_SIZE = 8
+        self.write("0123456789ER", mode="w")
+        self.assertEqual(scanner.scan(self.log_file, ["error"]), set())
+        self.write("ROR\n")
+        self.assertEqual(scanner.scan(self.log_file, ["error"]), {"error"})
+
+
+if __name__ == "__main__":
+    unittest.main()
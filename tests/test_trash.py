@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+"""Tests for the asynchronous deletion of `esm_runscripts.trash`."""
+
+
+import fcntl
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from esm_runscripts import trash
+
+
+class TestTrash(unittest.TestCase):
+    """Tests for `move_to_trash`, `empty_trash` and the worker."""
+
+    def setUp(self):
+        """Creates an experiment with two run folders."""
+        self.exp_dir = tempfile.mkdtemp()
+        self.trash = trash.trash_dir({"general": {"experiment_dir": self.exp_dir}})
+        self.run_dirs = []
+        for run in ["run_20000101-20001231", "run_20010101-20011231"]:
+            run_dir = os.path.join(self.exp_dir, run)
+            for folder in ["work", "outdata/echam", "restart/echam"]:
+                os.makedirs(os.path.join(run_dir, folder))
+                with open(os.path.join(run_dir, folder, "file.nc"), "w") as staged:
+                    staged.write("data")
+            os.symlink(
+                os.path.join(run_dir, "work", "file.nc"),
+                os.path.join(run_dir, "work", "link.nc"),
+            )
+            self.run_dirs.append(run_dir)
+
+    def tearDown(self):
+        """Removes the experiment."""
+        shutil.rmtree(self.exp_dir)
+
+    def trashed(self):
+        return sorted(name for name in os.listdir(self.trash) if name != trash.LOCK_NAME)
+
+    def test_move_to_trash(self):
+        """Folders are renamed into the trash under unique names."""
+        for run_dir in self.run_dirs:
+            self.assertTrue(trash.move_to_trash(run_dir, self.trash))
+            self.assertFalse(os.path.exists(run_dir))
+        os.makedirs(self.run_dirs[0])
+        self.assertTrue(trash.move_to_trash(self.run_dirs[0] + "/", self.trash))
+        trashed = self.trashed()
+        self.assertEqual(len(trashed), 3)
+        self.assertTrue(all(name.startswith("run_") for name in trashed))
+
+    def test_missing_folder(self):
+        """A folder that cannot be renamed is reported."""
+        self.assertFalse(
+            trash.move_to_trash(os.path.join(self.exp_dir, "missing"), self.trash)
+        )
+
+    def test_empty_trash(self):
+        """The trash is emptied in-process, the lock file is kept."""
+        for run_dir in self.run_dirs:
+            trash.move_to_trash(run_dir, self.trash)
+        open(os.path.join(self.trash, trash.LOCK_NAME), "a").close()
+        trash.empty_trash(self.trash, workers=2)
+        self.assertEqual(os.listdir(self.trash), [trash.LOCK_NAME])
+
+    def test_worker(self):
+        """The detached worker empties the trash."""
+        for run_dir in self.run_dirs:
+            trash.move_to_trash(run_dir, self.trash)
+        worker = trash.start_worker(self.trash, workers=2)
+        self.assertEqual(worker.wait(timeout=60), 0)
+        self.assertEqual(self.trashed(), [])
+
+    def test_racing_workers(self):
+        """Two workers started at once leave an empty trash."""
+        for run_dir in self.run_dirs:
+            trash.move_to_trash(run_dir, self.trash)
+        workers = [trash.start_worker(self.trash) for _ in range(2)]
+        for worker in workers:
+            self.assertEqual(worker.wait(timeout=60), 0)
+        self.assertEqual(self.trashed(), [])
+
+    def test_locked(self):
+        """A worker exits without deleting anything while the lock is held."""
+        trash.move_to_trash(self.run_dirs[0], self.trash)
+        with open(os.path.join(self.trash, trash.LOCK_NAME), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            result = subprocess.run(
+                [sys.executable, trash.__file__, self.trash], timeout=60
+            )
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(len(self.trashed()), 1)
+
+    def test_no_trash(self):
+        """No worker is started without a trash."""
+        self.assertIsNone(trash.start_worker(self.trash))
+
+
+if __name__ == "__main__":
+    unittest.main()